@@ -0,0 +1,200 @@
+# ann_index.py
+# Approximate nearest-neighbour index (IVF + product quantization) in pure NumPy.
+#
+# Vectors are bucketed by a coarse k-means quantizer (the inverted lists); the
+# residual of each vector from its bucket centroid is compressed to `m` one-byte
+# PQ codes. A query only visits the `nprobe` closest buckets and scores them with
+# per-subspace lookup tables, so cost grows with nprobe * n / nlist, not n.
+# Built indices are persisted per partition under ANN_DIR and reused while the
+# partition version matches.
+#
+# Usage (recall/latency report against the exact path):
+#   python ann_index.py --pk "ORG#demo#GUIDELINES" --k 8 --nprobe 4
+
+import os, re, time, argparse
+import numpy as np
+
+ANN_DIR        = os.getenv("ANN_INDEX_DIR", os.path.join(".cache", "ann"))
+PQ_SUBSPACES   = 48       # 384 dims -> 48 sub-vectors of 8 dims, 48 bytes per chunk
+PQ_CODEBOOK    = 256      # one uint8 code per subspace
+TRAIN_SAMPLE   = 50000    # rows used to train the quantizers
+ASSIGN_BATCH   = 65536    # rows per distance block, bounds temporary memory
+
+def _assign(x, cent):
+    """Nearest centroid (L2) of every row of `x`, computed in blocks."""
+    c2 = (cent ** 2).sum(1)
+    out = np.empty(len(x), dtype=np.int32)
+    for i in range(0, len(x), ASSIGN_BATCH):
+        blk = x[i:i + ASSIGN_BATCH]
+        out[i:i + ASSIGN_BATCH] = (c2[None, :] - 2.0 * (blk @ cent.T)).argmin(1)
+    return out
+
+def kmeans(x, k, iters=20, seed=0):
+    """Plain Lloyd's k-means; returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(x)))
+    cent = x[rng.choice(len(x), k, replace=False)].astype(np.float32, copy=True)
+    for _ in range(iters):
+        assign = _assign(x, cent)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        cent[nonempty] = sums / counts[nonempty, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):  # re-seed dead centroids from random points
+            cent[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return cent, _assign(x, cent)
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals over L2-normalized rows.
+
+    Attributes:
+        centroids (np.ndarray): (nlist, dim) coarse quantizer.
+        codebooks (np.ndarray): (m, ksub, dim // m) PQ codebooks for residuals.
+        codes (np.ndarray): (n, m) uint8 PQ codes, one row per indexed vector.
+        lists (np.ndarray): Row ids grouped by inverted list.
+        offsets (np.ndarray): (nlist + 1,) start of each list inside `lists`.
+        version (str): Partition version the index was built for.
+    """
+    def __init__(self, centroids, codebooks, codes, assign, version=""):
+        self.centroids, self.codebooks, self.codes = centroids, codebooks, codes
+        self.assign = assign
+        self.lists = np.argsort(assign, kind="stable").astype(np.int64)
+        counts = np.bincount(assign, minlength=len(centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.version = version
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, nlist=None, m=PQ_SUBSPACES, ksub=PQ_CODEBOOK, version="", seed=0):
+        n, dim = matrix.shape
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        while dim % m:
+            m -= 1
+        rng = np.random.default_rng(seed)
+        train = matrix[rng.choice(n, min(n, TRAIN_SAMPLE), replace=False)]
+        centroids, _ = kmeans(train, nlist, seed=seed)
+        assign = _assign(matrix, centroids)
+        resid = (matrix - centroids[assign]).reshape(n, m, dim // m)
+        tresid = (train - centroids[_assign(train, centroids)]).reshape(len(train), m, dim // m)
+        codebooks = np.zeros((m, min(ksub, len(train)), dim // m), dtype=np.float32)
+        codes = np.zeros((n, m), dtype=np.uint8)
+        for j in range(m):
+            codebooks[j], _ = kmeans(np.ascontiguousarray(tresid[:, j]), ksub, iters=10, seed=seed + j)
+            codes[:, j] = _assign(np.ascontiguousarray(resid[:, j]), codebooks[j])
+        return cls(centroids, codebooks, codes, assign, version)
+
+    def search(self, q, k, nprobe=None, allowed=None):
+        """
+        Approximate top-k rows for a normalized query.
+
+        Args:
+            q (np.ndarray): (dim,) L2-normalized query.
+            k (int): Number of candidates to return.
+            nprobe (int): Inverted lists to visit at least (default nlist // 8, at least 1);
+                further lists are probed, best centroid first, until `k` allowed rows
+                are collected, so small or filtered indexes still return k results.
+            allowed (np.ndarray): Optional boolean row mask (e.g. tier filter).
+
+        Returns:
+            tuple: (row ids, approximate inner-product scores), best first.
+        """
+        nprobe = min(self.nlist, nprobe or max(1, self.nlist // 8))
+        cs = self.centroids @ q
+        parts, found = [], 0
+        for i, c in enumerate(np.argsort(-cs, kind="stable")):
+            if i >= nprobe and found >= k:
+                break
+            r = self.lists[self.offsets[c]:self.offsets[c + 1]]
+            if allowed is not None:
+                r = r[allowed[r]]
+            parts.append(r)
+            found += len(r)
+        rows = np.concatenate(parts) if parts else self.lists[:0]
+        if len(rows) == 0 or k <= 0:
+            return rows[:0], np.zeros(0, dtype=np.float32)
+        m = len(self.codebooks)
+        lut = np.einsum("mkd,md->mk", self.codebooks, q.reshape(m, -1))   # (m, ksub)
+        approx = cs[self.assign[rows]] + lut[np.arange(m)[None, :], self.codes[rows]].sum(1)
+        top = np.argpartition(-approx, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-approx[top], kind="stable")]
+        return rows[top], approx[top]
+
+    def nbytes(self):
+        return self.centroids.nbytes + self.codebooks.nbytes + self.codes.nbytes + self.lists.nbytes
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, codebooks=self.codebooks, codes=self.codes,
+                 assign=self.assign, version=np.array(self.version))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(z["centroids"], z["codebooks"], z["codes"], z["assign"], str(z["version"]))
+
+def index_path(pk):
+    # "ORG#demo#GUIDELINES" -> .cache/ann/ORG_demo_GUIDELINES.npz
+    return os.path.join(ANN_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", pk) + ".npz")
+
+def load_or_build(matrix, version, pk):
+    """Reuse the persisted index for `pk` if it was built at `version`, else build and save it."""
+    path, version = index_path(pk), str(version)
+    if os.path.exists(path):
+        try:
+            idx = IVFPQIndex.load(path)
+            if idx.version == version and len(idx.codes) == len(matrix):
+                return idx
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable ANN index {path}: {e}")
+    idx = IVFPQIndex.build(matrix, version=version)
+    idx.save(path)
+    return idx
+
+def measure_recall(vindex, queries, k=8, nprobe=None, prefer_sot=False):
+    """
+    recall@k and mean latency of the ANN path against exact search on a VectorIndex.
+
+    Returns a dict with recall, exact/ann latency in ms and the query count.
+    """
+    hits, t_exact, t_ann = 0, 0.0, 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        exact = vindex.search(q, k, prefer_sot=prefer_sot)
+        t1 = time.perf_counter()
+        approx = vindex.search(q, k, prefer_sot=prefer_sot, method="ivfpq", nprobe=nprobe)
+        t2 = time.perf_counter()
+        t_exact += t1 - t0; t_ann += t2 - t1
+        hits += len({e["SK"] for e in exact} & {a["SK"] for a in approx})
+    n = max(1, len(queries))
+    return {"queries": len(queries), "k": k, "nprobe": nprobe,
+            "recall": round(hits / (n * min(k, len(vindex)) or 1), 4),
+            "exact_ms": round(1000 * t_exact / n, 3), "ann_ms": round(1000 * t_ann / n, 3)}
+
+if __name__ == "__main__":
+    import boto3
+    from vector_index import get_index
+
+    ap = argparse.ArgumentParser(description="Report IVF-PQ recall against exact retrieval.")
+    ap.add_argument("--pk", default="ORG#demo#GUIDELINES")
+    ap.add_argument("--table", default="EmbeddingsTable")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--nprobe", type=int, nargs="*", default=[1, 2, 4, 8])
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    vindex = get_index(boto3.resource("dynamodb", region_name="us-east-2").Table(args.table), args.pk)
+    rng = np.random.default_rng(0)
+    # perturbed copies of stored chunks stand in for real questions
+    picks = vindex.matrix[rng.choice(len(vindex), min(args.queries, len(vindex)), replace=False)]
+    queries = picks + rng.normal(scale=0.05, size=picks.shape).astype(np.float32)
+    for nprobe in args.nprobe:
+        print(measure_recall(vindex, queries, k=args.k, nprobe=nprobe))
@@ -0,0 +1,79 @@
+# answer_cache.py
+# Semantic cache of RAG answers for retrieve.ask_with_rag.
+#
+# An answer is reusable when a new question embeds close to a cached one (cosine >=
+# threshold) AND the packed guideline context sent to the model is byte-identical
+# (same chunks, versions and question-dependent trimming), so the model would have
+# seen the same evidence. Entries expire after a TTL, the table is LRU-bounded, and
+# it lives in a local SQLite file so it survives restarts and is shared across
+# processes.
+
+import os, json, time, hashlib
+import numpy as np
+
+from sqlite_cache import SQLiteLRU, lazy_default
+
+CACHE_PATH  = os.getenv("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite"))
+THRESHOLD   = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+def context_key(context, model=""):
+    """Digest of the model plus the exact context text (format_snippets output) it is sent."""
+    return hashlib.sha256(json.dumps([model, context]).encode("utf-8")).hexdigest()
+
+class AnswerCache(SQLiteLRU):
+    """
+    SQLite-backed semantic answer cache.
+
+    Attributes:
+        hits (int): Answers served from the cache by this process.
+        misses (int): Lookups that needed a model call.
+    """
+    TABLE = "answers"
+    # `snippets` holds the context_key digest
+    COLUMNS = ("id INTEGER PRIMARY KEY AUTOINCREMENT, snippets TEXT NOT NULL, vec BLOB NOT NULL,"
+               " question TEXT, answer TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL")
+    INDEXES = (("answers_snippets", "snippets"),)
+
+    def __init__(self, path=CACHE_PATH, threshold=THRESHOLD, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        super().__init__(path, max_entries)
+        self.threshold, self.ttl = threshold, ttl
+
+    def get(self, qvec, key):
+        """Cached answer for a question embedding + context key, or None."""
+        q = np.asarray(qvec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1e-9)
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, vec, answer FROM answers WHERE snippets = ? AND created >= ?",
+                (key, now - self.ttl),
+            ).fetchall()
+            best, best_sim = None, self.threshold
+            for rid, vec, answer in rows:
+                sim = float(np.frombuffer(vec, dtype=np.float32) @ q)
+                if sim >= best_sim:
+                    best, best_sim = (rid, answer), sim
+            if best is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best[0]))
+            self._db.commit()
+            self.hits += 1
+            return best[1]
+
+    def put(self, qvec, key, answer, question=None):
+        q = np.asarray(qvec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1e-9)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (snippets, vec, question, answer, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, q.tobytes(), question, answer, now, now),
+            )
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._evict()
+            self._db.commit()
+
+default_cache = lazy_default(AnswerCache)   # the process-wide answer cache at CACHE_PATH
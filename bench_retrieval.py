@@ -0,0 +1,200 @@
+# bench_retrieval.py
+# Retrieval benchmark over synthetic guideline corpora.
+#
+# Generates clustered 384-dim corpora (SoT/Ref tiers mixed 1:2) from 1k up to 1M
+# chunks and measures retrieval for each path: the original per-chunk Python cosine
+# loop ("legacy"), the in-memory matrix index ("exact"), BM25 prefilter + cosine
+# ("hybrid"), IVF-PQ ("ivfpq@nprobe"), quantized first pass + exact rescoring
+# ("int8", "pca128+int8", ...) and a memory-mapped snapshot ("snapshot"). Each chunk
+# gets synthetic terms drawn mostly from its topic's vocabulary, and each query a
+# few terms of the chunk it was perturbed from. Query embedding is excluded; every
+# path gets the same pre-computed query vectors. Reports p50/p99 latency, throughput,
+# index memory, build time and recall@k against brute force, written as JSON so runs
+# can be compared across commits.
+#
+# Usage:
+#   python bench_retrieval.py --sizes 1000 10000 100000 --out bench_retrieval.json
+
+import sys, json, time, tempfile, argparse, platform, resource, subprocess
+from datetime import datetime
+import numpy as np
+
+import ann_index
+import quantize
+import snapshot
+from lexical_index import encode_terms
+from vector_index import VectorIndex
+
+DIM = 384
+TOPIC_TERMS  = 30     # vocabulary per topic cluster
+GLOBAL_TERMS = 5000   # shared vocabulary
+CHUNK_TERMS  = (8, 4)  # topic / shared terms per chunk
+
+def synthetic_corpus(n, dim=DIM, clusters=None, seed=0):
+    """
+    (items, normalized matrix, words) for n chunks drawn around `clusters` topic centres.
+
+    words[i] are the chunk's synthetic terms (also stored as its `terms`, like ingest
+    does), mostly from its topic's vocabulary so lexical and vector similarity agree.
+    """
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(8, int(np.sqrt(n)))
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    mat = centres[labels] + rng.normal(scale=0.8, size=(n, dim)).astype(np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    wrng = np.random.default_rng(seed + 2)
+    topic = wrng.integers(0, TOPIC_TERMS, (n, CHUNK_TERMS[0]))
+    shared = wrng.integers(0, GLOBAL_TERMS, (n, CHUNK_TERMS[1]))
+    words = [[f"t{labels[i]}w{j}" for j in topic[i]] + [f"g{j}" for j in shared[i]] for i in range(n)]
+    items = [{"SK": f"DOC#bench#CHUNK#{i}", "uri": "bench", "span": "", "tier": "SoT" if i % 3 == 0 else "Ref",
+              "content": "", "terms": encode_terms(" ".join(words[i])), "updated_at": "bench"} for i in range(n)]
+    return items, mat, words
+
+def synthetic_queries(mat, words, n, seed=1):
+    # perturbed corpus rows stand in for real questions; their text is a few of the row's terms
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, len(mat), n)
+    q = mat[src] + rng.normal(scale=0.05, size=(n, mat.shape[1])).astype(np.float32)
+    texts = [" ".join(rng.choice(words[i][:CHUNK_TERMS[0]], 2, replace=False).tolist() + [words[i][-1]])
+             for i in src]
+    return q / np.linalg.norm(q, axis=1, keepdims=True), texts
+
+def cosine(a, b):
+    a = np.array(a, dtype=float); b = np.array(b, dtype=float)
+    den = (np.linalg.norm(a) * np.linalg.norm(b)) or 1e-9
+    return float(np.dot(a, b) / den)
+
+def legacy_search(items, vecs, q, k, prefer_sot=True):
+    """The pre-index retrieve_chunks: per-element float conversion, one cosine() per chunk, full sort."""
+    qvec = q.tolist()
+    scored = [dict(it, _score=cosine(qvec, [float(x) for x in vec])) for it, vec in zip(items, vecs)]
+    if prefer_sot:
+        scored.sort(key=lambda x: (x.get("tier") != "SoT", -x["_score"]))
+    else:
+        scored.sort(key=lambda x: -x["_score"])
+    return scored[:k]
+
+def time_path(fn, queries):
+    """Run fn over every query; returns (latencies in seconds, results)."""
+    lat, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q))
+        lat.append(time.perf_counter() - t0)
+    return np.asarray(lat), results
+
+def recall(results, truth, k):
+    hits = sum(len({r["SK"] for r in res} & {t["SK"] for t in tr}) for res, tr in zip(results, truth))
+    return round(hits / (len(truth) * k or 1), 4)
+
+def summarize(name, lat, results, truth, k, **extra):
+    return {
+        "path": name,
+        "p50_ms": round(1000 * float(np.percentile(lat, 50)), 4),
+        "p99_ms": round(1000 * float(np.percentile(lat, 99)), 4),
+        "qps": round(len(lat) / (float(lat.sum()) or 1e-9), 1),
+        f"recall@{k}": recall(results, truth, k),
+        **extra,
+    }
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bench_size(n, args):
+    items, mat, words = synthetic_corpus(n, seed=args.seed)
+    queries, texts = synthetic_queries(mat, words, args.queries, seed=args.seed + 1)
+    k = args.k
+
+    t0 = time.perf_counter()
+    vindex = VectorIndex(items, version=(n, "bench"), pk=f"BENCH#{n}", matrix=np.ascontiguousarray(mat))
+    build_exact = time.perf_counter() - t0
+
+    exact = lambda q: vindex.search(q, k, prefer_sot=args.prefer_sot)
+    lat, truth = time_path(exact, queries)
+    rows = [summarize("exact", lat, truth, truth, k, build_s=round(build_exact, 3),
+                      index_mb=round(vindex.matrix.nbytes / 2**20, 2))]
+
+    if n <= args.legacy_max:
+        vecs = mat.tolist()  # what the old path held after reading DynamoDB lists
+        lat, res = time_path(lambda q: legacy_search(items, vecs, q, k, args.prefer_sot), queries)
+        rows.append(summarize("legacy", lat, res, truth, k, index_mb=None))
+
+    # recall is agreement with pure vector search; chunks sharing no question term are never returned
+    # once k in a tier do, which is why retrieve_chunks keeps "exact" as its default
+    t0 = time.perf_counter()
+    bm25 = vindex.bm25()
+    build_bm25 = time.perf_counter() - t0
+    fn = lambda qt: vindex.search(qt[0], k, prefer_sot=args.prefer_sot, method="hybrid", text=qt[1])
+    lat, res = time_path(fn, list(zip(queries, texts)))
+    rows.append(summarize("hybrid", lat, res, truth, k, build_s=round(build_bm25, 3),
+                          index_mb=round(sum(ids.nbytes + w.nbytes for ids, w in bm25.postings.values()) / 2**20, 2)))
+
+    t0 = time.perf_counter()
+    vindex._ann = ann_index.IVFPQIndex.build(vindex.matrix, version="bench", seed=args.seed)
+    build_ann = time.perf_counter() - t0
+    for nprobe in args.nprobe:
+        fn = lambda q: vindex.search(q, k, prefer_sot=args.prefer_sot, method="ivfpq", nprobe=nprobe)
+        lat, res = time_path(fn, queries)
+        rows.append(summarize(f"ivfpq@{nprobe}", lat, res, truth, k, build_s=round(build_ann, 3),
+                              index_mb=round(vindex._ann.nbytes() / 2**20, 2), nlist=vindex._ann.nlist))
+
+    for spec in args.quant:
+        t0 = time.perf_counter()
+        qm = vindex.quantized(quantize.parse_spec(spec))
+        build_q = time.perf_counter() - t0
+        lat, res = time_path(lambda q: vindex.search(q, k, prefer_sot=args.prefer_sot, method=spec), queries)
+        rows.append(summarize(spec, lat, res, truth, k, build_s=round(build_q, 3),
+                              index_mb=round(qm.nbytes / 2**20, 2)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot.export(vindex, tmp)
+        t0 = time.perf_counter()
+        snap = snapshot.SnapshotIndex(tmp)
+        open_s = time.perf_counter() - t0
+        lat, res = time_path(lambda q: snap.search(q, k, prefer_sot=args.prefer_sot), queries)
+        rows.append(summarize("snapshot", lat, res, truth, k, open_s=round(open_s, 4),
+                              index_mb=round(snap.matrix.nbytes / 2**20, 2)))
+
+    for r in rows:
+        r["corpus_size"] = n
+        print(json.dumps(r))
+    return rows
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark retrieve_chunks paths on synthetic corpora.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 16])
+    ap.add_argument("--quant", nargs="*", default=["int8", "pca128", "pca128+int8"],
+                    help="Quantization specs to benchmark (see quantize.parse_spec)")
+    ap.add_argument("--legacy-max", type=int, default=10000, help="Largest corpus to run the legacy Python loop on")
+    ap.add_argument("--no-prefer-sot", dest="prefer_sot", action="store_false")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench_retrieval.json")
+    args = ap.parse_args()
+
+    results = []
+    for n in args.sizes:
+        results.extend(bench_size(n, args))
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "max_rss_mb": max_rss_mb(),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} result row(s) to {args.out}")
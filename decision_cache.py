@@ -0,0 +1,108 @@
+# decision_cache.py
+# Content-addressed cache of restock decisions for VendingAgent.
+#
+# Long simulations and reruns keep presenting the same machine state to the model.
+# The key is a sha256 over a canonical form of what build_prompt is given: stock
+# (name, quantity, shelf price), the balance rounded to a bucket, a digest of the
+# day's events without ids or seconds, the supplier table, the version of the
+# guideline partition retrieval reads from and the model id, so re-ingested
+# guidelines invalidate old decisions. Everything
+# is sorted so order and volatile fields do not matter. Only decisions whose plan
+# passed _prepare_data_for_update are stored, together with how long the model
+# call took, so hits can report the latency they saved. Entries live in local
+# SQLite and are evicted least-recently-used past a size bound.
+
+import os, json, time, hashlib
+from collections import Counter
+
+from sqlite_cache import SQLiteLRU, lazy_default
+
+CACHE_PATH     = os.getenv("DECISION_CACHE_PATH", os.path.join(".cache", "decisions.sqlite"))
+MAX_ENTRIES    = int(os.getenv("DECISION_CACHE_MAX_ENTRIES", "2000"))
+BALANCE_BUCKET = float(os.getenv("DECISION_CACHE_BALANCE_BUCKET", "1"))   # dollars
+BYPASS         = os.getenv("DECISION_CACHE_BYPASS", "") not in ("", "0", "false")
+KEY_VERSION    = 3   # bump when the prompt or the key's canonical form changes
+
+def _num(x):
+    try:
+        return round(float(x), 2)
+    except (TypeError, ValueError):
+        return None
+
+def _event_digest(events):
+    # what the prompt sees: type, title, price and hour; ids and seconds are noise
+    c = Counter((e.get("type"), e.get("title"), _num(e.get("price")), (e.get("time") or "")[11:13])
+                for e in events)
+    return sorted([list(k) + [n] for k, n in c.items()], key=str)
+
+def decision_key(stock, balance, events, supplier_info, model, guidelines=None):
+    """
+    sha256 of the canonical restock inputs + model id.
+
+    `guidelines` is the guideline partition version (see
+    retrieval.guidelines_version).
+    """
+    canon = {
+        "v": KEY_VERSION,
+        "model": model,
+        "guidelines": list(guidelines) if guidelines is not None else None,
+        # closing-stock rows carry `price`; rows written by the agent carry `selling_price`
+        "stock": sorted(([s.get("product_name"), int(s.get("quantity", 0)),
+                          _num(s.get("selling_price", s.get("price")))] for s in stock), key=str),
+        "balance": int((_num(balance) or 0.0) // BALANCE_BUCKET),
+        "events": _event_digest(events),
+        "supplier": sorted(([s.get("product_name"), _num(s.get("price"))] for s in supplier_info), key=str),
+    }
+    return hashlib.sha256(json.dumps(canon, sort_keys=True).encode("utf-8")).hexdigest()
+
+class DecisionCache(SQLiteLRU):
+    """
+    SQLite-backed LRU cache of validated LLM decisions.
+
+    Attributes:
+        hits (int): Decisions served from the cache by this process.
+        misses (int): Lookups that needed a model call.
+        saved_s (float): Model latency avoided by the hits.
+    """
+    TABLE = "decisions"
+    COLUMNS = ("key TEXT PRIMARY KEY, model TEXT NOT NULL, decision TEXT NOT NULL,"
+               " llm_seconds REAL NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL")
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        super().__init__(path, max_entries)
+        self.saved_s = 0.0
+
+    def get(self, key):
+        """The cached decision dict for `key`, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT decision, llm_seconds FROM decisions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE decisions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            self.saved_s += row[1]
+        return json.loads(row[0])
+
+    def put(self, key, decision, model, llm_seconds):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO decisions (key, model, decision, llm_seconds, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(decision), float(llm_seconds), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def delete(self, key):
+        """Forget the decision for `key`, e.g. a plan that no longer passes validation."""
+        with self._lock:
+            self._db.execute("DELETE FROM decisions WHERE key = ?", (key,))
+            self._db.commit()
+
+    def stats(self):
+        return dict(super().stats(), saved_s=round(self.saved_s, 2))
+
+default_cache = lazy_default(DecisionCache)   # the process-wide decision cache at CACHE_PATH
@@ -0,0 +1,100 @@
+# decision_schema.py
+# The restock decision as an Anthropic tool with a strict JSON schema.
+#
+# Forcing the model to call submit_restock_plan makes the API return the decision as
+# a parsed object (tool_use.input) instead of JSON buried in prose and ```json fences.
+# validate_decision re-checks what the schema says (the model can still violate it)
+# and returns readable errors. VendingAgent sends those back for a bounded number of
+# repair attempts instead of aborting the cycle.
+
+from stream_json import StreamAbort, is_whole, validate_plan_entry
+
+TOOL_NAME   = "submit_restock_plan"
+MAX_REPAIRS = 2    # extra attempts after an invalid decision
+
+RESTOCK_TOOL = {
+    "name": TOOL_NAME,
+    "description": "Submit tonight's restock decision for the vending machine.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "restock_plan": {
+                "type": "array",
+                "description": "One entry per product that will be in the machine after restocking.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "product_name": {"type": "string", "description": "Exactly as in the supplier catalog."},
+                        "quantity_to_buy": {"type": "integer", "minimum": 0, "maximum": 10},
+                        "selling_price": {"type": "number", "minimum": 0},
+                        "final_quantity": {"type": "integer", "minimum": 0, "maximum": 10,
+                                           "description": "Current quantity + quantity_to_buy."},
+                    },
+                    "required": ["product_name", "quantity_to_buy", "selling_price", "final_quantity"],
+                    "additionalProperties": False,
+                },
+                "maxItems": 10,
+            },
+            "reasoning": {"type": "string"},
+            "guideline_use": {"type": "string",
+                              "description": "What the guidelines said and how they were applied."},
+        },
+        "required": ["restock_plan", "reasoning", "guideline_use"],
+        "additionalProperties": False,
+    },
+}
+TOOL_CHOICE = {"type": "tool", "name": TOOL_NAME}
+
+def validate_decision(decision):
+    """List of schema violations in a decision dict (empty if valid); never raises."""
+    if not isinstance(decision, dict):
+        return [f"decision must be an object, got {type(decision).__name__}"]
+    errors = []
+    schema = RESTOCK_TOOL["input_schema"]
+    for key in schema["required"]:
+        if key not in decision:
+            errors.append(f"missing required field {key!r}")
+    for key in decision:
+        if key not in schema["properties"]:
+            errors.append(f"unexpected field {key!r}")
+    for key in ("reasoning", "guideline_use"):
+        if key in decision and not isinstance(decision[key], str):
+            errors.append(f"{key!r} must be a string")
+    plan = decision.get("restock_plan")
+    if plan is None:
+        return errors
+    if not isinstance(plan, list):
+        return errors + ["'restock_plan' must be an array"]
+    if len(plan) > 10:
+        errors.append(f"'restock_plan' has {len(plan)} entries; the machine has 10 slots")
+    item = schema["properties"]["restock_plan"]["items"]
+    seen = set()
+    for i, entry in enumerate(plan):
+        try:
+            validate_plan_entry(entry)
+        except StreamAbort as e:
+            errors.append(f"restock_plan[{i}]: {e}")
+            continue
+        missing = [k for k in item["required"] if k not in entry]
+        extra = [k for k in entry if k not in item["properties"]]
+        if missing:
+            errors.append(f"restock_plan[{i}] ({entry['product_name']}): missing {', '.join(missing)}")
+        if extra:
+            errors.append(f"restock_plan[{i}] ({entry['product_name']}): unexpected {', '.join(extra)}")
+        if entry.get("quantity_to_buy", 0) > 10:   # a missing field is already reported above
+            errors.append(f"restock_plan[{i}] ({entry['product_name']}): quantity_to_buy above slot capacity 10")
+        final = entry.get("final_quantity")
+        if final is not None and (not is_whole(final) or not 0 <= final <= 10):
+            errors.append(f"restock_plan[{i}] ({entry['product_name']}): final_quantity must be an integer 0-10")
+        if entry["product_name"] in seen:
+            errors.append(f"restock_plan[{i}]: duplicate product {entry['product_name']!r}")
+        seen.add(entry["product_name"])
+    return errors
+
+def repair_prompt(prompt, errors):
+    """`prompt` with the validation errors of the previous attempt appended to the user turn."""
+    note = ("Your previous " + TOOL_NAME + " call was rejected:\n- " + "\n- ".join(errors) +
+            "\nCall " + TOOL_NAME + " again with a corrected decision.")
+    *head, last = prompt["messages"]
+    fixed = dict(last, content=list(last["content"]) + [{"type": "text", "text": note}])
+    return dict(prompt, messages=head + [fixed])
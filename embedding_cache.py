@@ -0,0 +1,96 @@
+# embedding_cache.py
+# Persistent LRU cache of query embeddings in front of embedding_model.encode.
+#
+# Restock cycles embed the same (or trivially different) request text over and over.
+# Entries live in a local SQLite file keyed by sha256(model name + normalized text),
+# so they survive restarts and are shared by every process on the machine. Misses go
+# to the shared embedding server when one is running (see embedding_server).
+
+import os, time, hashlib
+import numpy as np
+
+import embedding_server
+from sqlite_cache import SQLiteLRU, lazy_default
+
+CACHE_PATH  = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "query_embeddings.sqlite"))
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+def normalize(text):
+    # MiniLM is uncased and whitespace-insensitive, so these texts embed identically
+    return " ".join(text.lower().split())
+
+class EmbeddingCache(SQLiteLRU):
+    """
+    SQLite-backed LRU cache of float32 embeddings.
+
+    Attributes:
+        hits (int): Lookups served from the cache by this process.
+        misses (int): Lookups that had to run the model.
+    """
+    TABLE = "embeddings"
+    COLUMNS = "key TEXT PRIMARY KEY, model TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL"
+
+    def __init__(self, path=CACHE_PATH, model_name=None, max_entries=MAX_ENTRIES):
+        super().__init__(path, max_entries)
+        self.model_name = model_name or embedding_server.model_id()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def encode(self, texts):
+        """Embeddings for `texts` as an (n, dim) float32 array; misses are encoded in one batch."""
+        keys = [self.key(t) for t in texts]
+        found = self._get_many(set(keys))
+        n_miss = sum(1 for k in keys if k not in found)
+        with self._lock:
+            self.hits += len(keys) - n_miss
+            self.misses += n_miss
+        missing = list(dict.fromkeys(k for k in keys if k not in found))  # unique, in order
+        if missing:
+            text_of = dict(zip(keys, texts))
+            vecs = embedding_server.encode([text_of[k] for k in missing])
+            self._put_many(zip(missing, vecs))
+            found.update(zip(missing, vecs))
+        return np.stack([found[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        keys = list(keys)
+        with self._lock:
+            rows = []
+            for i in range(0, len(keys), 500):  # stay under SQLite's host-parameter limit
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows += self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                self._db.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time(), *part])
+            self._db.commit()
+        return {k: np.frombuffer(v, dtype=np.float32) for k, v in rows}
+
+    def _put_many(self, pairs):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(k, self.model_name, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in pairs],
+            )
+            self._evict()
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return dict(super().stats(), size=size)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+
+default_cache = lazy_default(EmbeddingCache)   # the process-wide cache at CACHE_PATH
+
+def cached_encode(texts):
+    """Drop-in for embedding_model.encode on query text, served through the default cache."""
+    return default_cache().encode(list(texts))
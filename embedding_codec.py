@@ -0,0 +1,39 @@
+# embedding_codec.py
+# Packed binary storage for chunk embeddings in EmbeddingsTable.
+#
+# A 384-dim MiniLM vector as a DynamoDB list of Decimals is ~4-5KB per item; packed
+# little-endian float32 it is 1536 bytes (768 with float16), and decodes with a
+# single np.frombuffer instead of a per-element Decimal -> float conversion.
+
+import numpy as np
+
+DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+DEFAULT_DTYPE = "float32"
+
+def pack(vec, dtype=DEFAULT_DTYPE):
+    """Pack a vector into bytes for a DynamoDB Binary attribute."""
+    return np.asarray(vec, dtype=DTYPES[dtype]).tobytes()
+
+def embedding_attrs(vec, dtype=DEFAULT_DTYPE):
+    """Item attributes for a packed embedding (`embedding`, `embedding_dtype`)."""
+    return {"embedding": pack(vec, dtype), "embedding_dtype": dtype}
+
+def unpack(value, dtype=DEFAULT_DTYPE):
+    """
+    Decode a stored embedding into a 1-D numpy array.
+
+    Binary values (boto3 `Binary` or raw bytes) are viewed zero-copy with
+    np.frombuffer, so the result is read-only. Legacy Decimal lists are still
+    accepted so old rows keep working until they are migrated.
+    """
+    raw = getattr(value, "value", value)  # boto3.dynamodb.types.Binary -> bytes
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return np.frombuffer(raw, dtype=DTYPES[dtype])
+    return np.asarray([float(x) for x in raw], dtype=np.float32)
+
+def unpack_item(item):
+    """Decode the embedding of a chunk row, honouring its `embedding_dtype`."""
+    return unpack(item["embedding"], item.get("embedding_dtype", DEFAULT_DTYPE))
+
+def is_packed(item):
+    return isinstance(getattr(item.get("embedding"), "value", item.get("embedding")), (bytes, bytearray, memoryview))
@@ -0,0 +1,192 @@
+# embedding_model.py
+# One lazily-loaded, process-wide MiniLM model shared by ingest, prompt_builder and retrieve.
+#
+# Importing this module is cheap: the backend (and torch, if it needs it) is only
+# imported the first time something is actually encoded, so runs that never retrieve
+# never pay for the model.
+#
+# EMBEDDING_BACKEND picks the implementation of all-MiniLM-L6-v2:
+#   "torch"        SentenceTransformer on PyTorch (reference)
+#   "torch-qint8"  the same with dynamically int8-quantized Linear layers
+#   "onnx"         ONNX Runtime + HF tokenizers, no torch import at all
+#
+# Usage:
+#   python embedding_model.py export-onnx            # writes EMBEDDING_ONNX_DIR (+ int8 variant)
+#   python embedding_model.py verify --backend onnx  # numeric check against the torch model
+
+import os, json, time, argparse, threading
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import numpy as np
+
+MODEL_NAME  = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_SEQ_LEN = 256   # MiniLM truncates longer inputs
+BACKEND     = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_DIR    = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+ONNX_FILE   = os.getenv("EMBEDDING_ONNX_FILE")   # default: model_quantized.onnx if present, else model.onnx
+
+class TorchBackend:
+    """SentenceTransformer on PyTorch, optionally with dynamic int8 quantization of Linear layers."""
+    def __init__(self, quantized=False):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(MODEL_NAME)
+        if quantized:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts, **kwargs):
+        return self.model.encode(texts, **kwargs)
+
+    def token_count(self, text):
+        return len(self.model.tokenizer.tokenize(text))
+
+class OnnxBackend:
+    """
+    all-MiniLM-L6-v2 exported to ONNX: tokenizers -> transformer -> mean pooling -> L2 normalize,
+    the same pipeline SentenceTransformer runs for this model.
+    """
+    def __init__(self, path=ONNX_DIR, filename=ONNX_FILE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LEN)
+        self.tokenizer.enable_padding()
+        self._counter = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))  # untruncated, for token_count
+        if filename is None:
+            filename = "model_quantized.onnx" if os.path.exists(os.path.join(path, "model_quantized.onnx")) else "model.onnx"
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(path, filename), opts, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32, **_):
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer.encode_batch(list(texts[i:i + batch_size]))
+            ids = np.array([e.ids for e in enc], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.inputs})[0]
+            m = mask[..., None].astype(np.float32)
+            pooled = (hidden * m).sum(1) / np.maximum(m.sum(1), 1e-9)
+            out.append(pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12))
+        return np.vstack(out).astype(np.float32) if out else np.zeros((0, 384), dtype=np.float32)
+
+    def token_count(self, text):
+        return len(self._counter.encode(text, add_special_tokens=False).ids)
+
+def make_backend(name=None):
+    name = name or BACKEND
+    if name == "torch":
+        return TorchBackend()
+    if name == "torch-qint8":
+        return TorchBackend(quantized=True)
+    if name == "onnx":
+        return OnnxBackend()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name!r}")
+
+_model = None
+_lock  = threading.Lock()
+
+def get_model():
+    """Return the shared embedding backend, loading it on first use (thread-safe)."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:  # another thread may have loaded it while we waited
+                _model = make_backend()
+    return _model
+
+def model_id():
+    # backends differ numerically, so caches key on the backend too
+    return f"{MODEL_NAME}|{BACKEND}"
+
+def encode(texts, **kwargs):
+    """Encode a list of texts with the shared model (same kwargs as SentenceTransformer.encode)."""
+    return get_model().encode(texts, **kwargs)
+
+def token_count(text):
+    # wordpieces as seen by the embedding model (MiniLM truncates at 256)
+    return get_model().token_count(text)
+
+def warm_up(background=False):
+    """
+    Load the model and run one tiny encode so the first real query is fast.
+
+    With background=True this happens on a daemon thread and the thread is
+    returned, so callers can overlap model loading with other I/O.
+    """
+    if background:
+        t = threading.Thread(target=warm_up, name="embedding-warm-up", daemon=True)
+        t.start()
+        return t
+    encode(["warm-up"])
+
+def is_loaded():
+    return _model is not None
+
+def export_onnx(out_dir=ONNX_DIR, quantize=True):
+    """Export the transformer to ONNX (+ a dynamically int8-quantized copy) with its tokenizer."""
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    os.makedirs(out_dir, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME).eval()
+    enc = tok(["an example sentence"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(enc[n] for n in names), path,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    tok.save_pretrained(out_dir)  # tokenizer.json for the fast `tokenizers` runtime
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(path, os.path.join(out_dir, "model_quantized.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+def verify(backend, texts, min_cosine=0.99):
+    """Compare `backend` against the torch reference on `texts`; returns a report dict."""
+    ref_backend = TorchBackend()
+    ref = np.asarray(ref_backend.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    t0 = time.perf_counter(); ref_backend.encode(texts); t_ref = time.perf_counter() - t0
+    cand = make_backend(backend)
+    got = np.asarray(cand.encode(texts), dtype=np.float32)
+    t0 = time.perf_counter(); cand.encode(texts); t_got = time.perf_counter() - t0
+    cos = (ref * got).sum(1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(got, axis=1))
+    return {
+        "backend": backend, "texts": len(texts),
+        "min_cosine": round(float(cos.min()), 5), "mean_cosine": round(float(cos.mean()), 5),
+        "max_abs_diff": round(float(np.abs(ref - got).max()), 5),
+        "torch_s": round(t_ref, 3), "backend_s": round(t_got, 3),
+        "ok": bool(cos.min() >= min_cosine),
+    }
+
+def _sample_texts(limit=256):
+    import glob
+    texts = ["Please add sparkling water", "More healthy snacks please", "Coffee is too expensive"]
+    for path in sorted(glob.glob("corpus/*.md")):
+        with open(path, encoding="utf-8") as f:
+            texts += [p for p in f.read().split("\n\n") if p.strip()]
+    return texts[:limit]
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embedding backend tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export-onnx", help="Export all-MiniLM-L6-v2 to ONNX")
+    ex.add_argument("--out", default=ONNX_DIR)
+    ex.add_argument("--no-quantize", dest="quantize", action="store_false")
+    ve = sub.add_parser("verify", help="Check a backend numerically against the torch model")
+    ve.add_argument("--backend", default="onnx", choices=["torch-qint8", "onnx"])
+    ve.add_argument("--min-cosine", type=float, default=0.99)
+    args = ap.parse_args()
+
+    if args.cmd == "export-onnx":
+        print(f"Exported ONNX model to {export_onnx(args.out, args.quantize)}")
+    else:
+        report = verify(args.backend, _sample_texts(), args.min_cosine)
+        print(json.dumps(report, indent=2))
+        raise SystemExit(0 if report["ok"] else 1)
@@ -0,0 +1,199 @@
+# embedding_server.py
+# One shared embedding model for every orchestrator / simulation process on a machine.
+#
+# Each worker that embeds locally loads its own copy of MiniLM. Instead, run
+#   python embedding_server.py
+# once; it loads the model (EMBEDDING_BACKEND as usual) and listens on a UNIX socket.
+# Requests that arrive close together from different clients are merged into one
+# encode call (dynamic batching), so N workers cost one model in memory and the
+# forward passes run on full batches.
+#
+# Clients call encode() here: it goes to the server when the socket is up and falls
+# back to the in-process model otherwise, so callers never need to know which.
+# embedding_cache routes its misses through it, which makes retrieve_chunks use the
+# server transparently.
+
+import os, time, queue, argparse, threading
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+import embedding_model
+
+SOCKET_PATH   = os.getenv("EMBEDDING_SERVER_SOCKET", os.path.join(".cache", "embedding.sock"))
+MAX_BATCH     = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "256"))      # texts per forward pass
+MAX_WAIT_MS   = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))    # how long to hold a batch open
+RETRY_SECONDS = 30    # after a failed connect, use the local model this long before trying again
+
+class _Job:
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = self.error = None
+        self.done = threading.Event()
+
+class EmbeddingServer:
+    """
+    Dynamic-batching embedding service on a UNIX socket.
+
+    Attributes:
+        stats (dict): requests, texts, batches and encode seconds served so far.
+    """
+    def __init__(self, path=SOCKET_PATH, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.path, self.max_batch, self.max_wait = path, max_batch, max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0, "encode_s": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def serve_forever(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # stale socket from a previous run
+        embedding_model.warm_up()
+        listener = Listener(self.path, family="AF_UNIX")
+        os.chmod(self.path, 0o600)  # messages are pickled: only this user may connect
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        print(f"Embedding server ({embedding_model.model_id()}) listening on {self.path}")
+        try:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                op = msg[0]
+                if op == "encode":
+                    job = _Job(list(msg[1]))
+                    self.queue.put(job)
+                    job.done.wait()
+                    reply = ("ok", job.result) if job.error is None else ("error", job.error)
+                elif op == "model_id":
+                    reply = ("ok", embedding_model.model_id())
+                elif op == "stats":
+                    reply = ("ok", self.report())
+                else:
+                    reply = ("error", f"unknown op {op!r}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def _batch_loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            n = len(jobs[0].texts)
+            # hold the batch open briefly so concurrent clients share the forward pass
+            deadline = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                n += len(job.texts)
+            self._run(jobs)
+
+    def _run(self, jobs):
+        texts = [t for j in jobs for t in j.texts]
+        t0 = time.perf_counter()
+        try:
+            vecs = np.asarray(embedding_model.encode(texts, batch_size=self.max_batch), dtype=np.float32)
+            off = 0
+            for j in jobs:
+                j.result = vecs[off:off + len(j.texts)]
+                off += len(j.texts)
+        except Exception as e:
+            for j in jobs:
+                j.error = repr(e)
+        with self._stats_lock:
+            self.stats["requests"] += len(jobs)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+            self.stats["encode_s"] += time.perf_counter() - t0
+        for j in jobs:
+            j.done.set()
+
+    def report(self):
+        with self._stats_lock:
+            s = dict(self.stats)
+        s["avg_batch"] = round(s["texts"] / s["batches"], 2) if s["batches"] else 0.0
+        s["encode_s"] = round(s["encode_s"], 3)
+        return s
+
+# ---- client side ----
+
+_conn = None
+_lock = threading.Lock()
+_down_until = 0.0
+
+def _connect():
+    global _conn, _down_until
+    if _conn is None:
+        if time.monotonic() < _down_until or not os.path.exists(SOCKET_PATH):
+            return None
+        try:
+            _conn = Client(SOCKET_PATH, family="AF_UNIX")
+        except OSError:
+            _down_until = time.monotonic() + RETRY_SECONDS
+            return None
+    return _conn
+
+def _call(*msg):
+    """Send one request to the server; None if it is not reachable."""
+    global _conn, _down_until
+    with _lock:
+        conn = _connect()
+        if conn is None:
+            return None
+        try:
+            conn.send(msg)
+            status, value = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            _conn, _down_until = None, time.monotonic() + RETRY_SECONDS
+            return None
+    if status != "ok":
+        raise RuntimeError(f"Embedding server error: {value}")
+    return value
+
+def available():
+    with _lock:
+        return _connect() is not None
+
+def encode(texts):
+    """(n, dim) float32 embeddings from the shared server, or the in-process model if none is running."""
+    texts = list(texts)
+    vecs = _call("encode", texts)
+    if vecs is None:
+        vecs = embedding_model.encode(texts)
+    return np.asarray(vecs, dtype=np.float32)
+
+def model_id():
+    # the server's backend decides what the vectors are, so caches key on its id
+    return _call("model_id") or embedding_model.model_id()
+
+def server_stats():
+    return _call("stats")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Shared dynamic-batching embedding server.")
+    ap.add_argument("--socket", default=SOCKET_PATH)
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    ap.add_argument("--stats", action="store_true", help="print a running server's stats and exit")
+    args = ap.parse_args()
+
+    if args.stats:
+        SOCKET_PATH = args.socket
+        print(server_stats() or f"No embedding server on {args.socket}")
+    else:
+        EmbeddingServer(args.socket, args.max_batch, args.max_wait_ms).serve_forever()
@@ -1,49 +1,250 @@
-import os, glob, uuid, json, decimal, boto3
+import os, glob, uuid, json, time, hashlib, argparse, threading, boto3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
 from boto3.dynamodb.conditions import Key
+from embedding_codec import embedding_attrs
+from lexical_index import encode_terms
+from vector_index import VERSION_SK
+import embedding_model
+from embedding_model import token_count
 
 ORG_ID = "demo"
+REGION = "us-east-2"
 TABLE = "EmbeddingsTable"
-dynamodb = boto3.resource("dynamodb", region_name="us-east-2")
+BATCH_SIZE = 256          # chunks per encode + write batch
+ENCODE_BATCH_SIZE = 64    # SentenceTransformer forward-pass batch
+WRITE_WORKERS = 4         # concurrent batch_writer threads
+CHUNK_WORDS = 400         # chunk size limit in words
+CHUNK_OVERLAP = 0         # words carried over between consecutive chunks
+dynamodb = boto3.resource("dynamodb", region_name=REGION)
 table = dynamodb.Table(TABLE)
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-def chunk(text, max_words=400):
-    out, buf = [], []
-    for para in [p for p in text.split("\n\n") if p.strip()]:
-        if sum(len(x.split()) for x in buf) + len(para.split()) > max_words:
-            out.append("\n\n".join(buf)); buf=[para]
-        else:
-            buf.append(para)
-    if buf: out.append("\n\n".join(buf))
-    return out
-
-def to_decimal(vec):
-    # DynamoDB Numbers are Decimals; keep 6 dp to shrink size
-    return [decimal.Decimal(f"{x:.6f}") for x in vec]
-
-def ingest_path(path, tier):
-    uri = os.path.basename(path)
-    text = open(path, encoding="utf-8").read()
-    chs = chunk(text)
-    for i, c in enumerate(chs):
-        emb = model.encode([c])[0]
-        item = {
-            "PK": f"ORG#{ORG_ID}#GUIDELINES",
-            "SK": f"DOC#{uri}#CHUNK#{i}",
-            "content": c,
-            "embedding": to_decimal(emb),
-            "tier": tier,                # "SoT" or "Ref"
-            "uri": uri,
-            "span": f"L{i*100}-L{i*100+99}",
-            "updated_at": datetime.utcnow().isoformat()+"Z",
-        }
-        table.put_item(Item=item)
-
-# Example: mark *_policy.md as SoT, everything else Ref
-for path in glob.glob("corpus/*"):
-    tier = "SoT" if path.endswith("_policy.md") or "payment" in path or "identity" in path else "Ref"
-    ingest_path(path, tier)
-
-print("Ingested guideline chunks into DynamoDB.")
+EMBEDDING_DTYPE = "float32"   # or "float16" for half-size items
+
+def iter_paragraphs(lines):
+    """Yield (start_line, end_line, text) for blank-line separated paragraphs; lines are 1-based."""
+    buf, start = [], None
+    for n, line in enumerate(lines, start=1):
+        if line.strip():
+            if start is None: start = n
+            buf.append(line.rstrip("\n"))
+        elif buf:
+            yield start, n - 1, "\n".join(buf)
+            buf, start = [], None
+    if buf: yield start, start + len(buf) - 1, "\n".join(buf)
+
+def word_count(text):
+    return len(text.split())
+
+def chunk_stream(lines, max_words=400, overlap=0, max_tokens=None):
+    """
+    Streaming chunker over an iterable of lines.
+
+    Paragraphs are packed into chunks of at most `max_words` words (or
+    `max_tokens` model tokens when given) using a running count, so each
+    paragraph is counted once. The last paragraphs of a chunk, up to `overlap`
+    words/tokens, are repeated at the start of the next one. A single paragraph
+    larger than the limit becomes its own chunk.
+
+    Yields (start_line, end_line, text) with the real 1-based source lines.
+    """
+    count, limit = (token_count, max_tokens) if max_tokens else (word_count, max_words)
+    buf, total = deque(), 0   # buf holds (start, end, text, n)
+    for start, end, para in iter_paragraphs(lines):
+        n = count(para)
+        if buf and total + n > limit:
+            yield buf[0][0], buf[-1][1], "\n\n".join(p[2] for p in buf)
+            # keep a tail of whole paragraphs as overlap for the next chunk
+            kept, kept_n = deque(), 0
+            while buf and kept_n + buf[-1][3] <= overlap and kept_n + buf[-1][3] + n <= limit:
+                p = buf.pop(); kept.appendleft(p); kept_n += p[3]
+            buf, total = kept, kept_n
+        buf.append((start, end, para, n)); total += n
+    if buf: yield buf[0][0], buf[-1][1], "\n\n".join(p[2] for p in buf)
+
+def chunk(text, max_words=400, overlap=0, max_tokens=None):
+    return [c for _, _, c in chunk_stream(text.splitlines(), max_words, overlap, max_tokens)]
+
+def tier_for(path):
+    # Example: mark *_policy.md as SoT, everything else Ref
+    return "SoT" if path.endswith("_policy.md") or "payment" in path or "identity" in path else "Ref"
+
+def iter_chunks(paths, tier=None, max_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP, max_tokens=None):
+    """Stream (uri, tier, chunk_index, content, span) across every file in `paths`, reading lines lazily."""
+    for path in paths:
+        uri = os.path.basename(path)
+        with open(path, encoding="utf-8") as f:
+            for i, (start, end, c) in enumerate(chunk_stream(f, max_words, overlap, max_tokens)):
+                yield uri, tier or tier_for(path), i, c, f"L{start}-L{end}"
+
+def batched(iterable, n):
+    buf = []
+    for x in iterable:
+        buf.append(x)
+        if len(buf) == n:
+            yield buf; buf = []
+    if buf: yield buf
+
+def chunk_key(uri, i):
+    return f"DOC#{uri}#CHUNK#{i}"
+
+def uri_of(sk):
+    # "DOC#{uri}#CHUNK#{i}" -> uri
+    return sk[len("DOC#"):sk.rindex("#CHUNK#")]
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def make_item(uri, tier, i, content, span, emb, dtype=EMBEDDING_DTYPE):
+    return {
+        "PK": f"ORG#{ORG_ID}#GUIDELINES",
+        "SK": chunk_key(uri, i),
+        "content": content,
+        "content_hash": content_hash(content),
+        "terms": encode_terms(content),  # BM25 term frequencies, see lexical_index
+        **embedding_attrs(emb, dtype),  # packed Binary, see embedding_codec
+        "tier": tier,                # "SoT" or "Ref"
+        "uri": uri,
+        "span": span,                # real source lines, e.g. "L12-L40"
+        "updated_at": datetime.utcnow().isoformat()+"Z",
+    }
+
+_local = threading.local()
+
+def _thread_table():
+    # boto3 resources are not thread-safe; give each writer thread its own
+    if not hasattr(_local, "table"):
+        _local.table = boto3.session.Session().resource("dynamodb", region_name=REGION).Table(TABLE)
+    return _local.table
+
+def write_items(items):
+    """Write one encoded batch through batch_writer (25-item BatchWriteItem calls, retries unprocessed)."""
+    with _thread_table().batch_writer() as batch:
+        for it in items:
+            batch.put_item(Item=it)
+    return len(items)
+
+def existing_chunks():
+    """{SK: (content_hash, tier, span)} for every chunk row already in this org's partition (no embeddings)."""
+    cond = Key("PK").eq(f"ORG#{ORG_ID}#GUIDELINES") & Key("SK").begins_with("DOC#")
+    kwargs = {"KeyConditionExpression": cond, "ProjectionExpression": "SK, content_hash, tier, #s",
+              "ExpressionAttributeNames": {"#s": "span"}}
+    known, resp = {}, table.query(**kwargs)
+    while True:
+        for it in resp["Items"]:
+            known[it["SK"]] = (it.get("content_hash"), it.get("tier"), it.get("span"))
+        if "LastEvaluatedKey" not in resp:
+            return known
+        resp = table.query(ExclusiveStartKey=resp["LastEvaluatedKey"], **kwargs)
+
+def _changed_only(chunks, known, seen, stats, respan):
+    """
+    Drop chunks whose stored hash and tier already match; record every key produced.
+
+    Unchanged chunks that merely moved lines are queued in `respan` so only their
+    `span` attribute is rewritten, without re-embedding.
+    """
+    for uri, tier, i, c, span in chunks:
+        sk = chunk_key(uri, i)
+        seen.add(sk)
+        old = known.get(sk)
+        if old and old[:2] == (content_hash(c), tier):
+            stats["skipped"] += 1
+            if old[2] != span:
+                respan.append((sk, span))
+            continue
+        yield uri, tier, i, c, span
+
+def update_spans(pairs):
+    """Rewrite `span` (and `updated_at`) on chunks whose content did not change."""
+    now = datetime.utcnow().isoformat()+"Z"
+    for sk, span in pairs:
+        table.update_item(
+            Key={"PK": f"ORG#{ORG_ID}#GUIDELINES", "SK": sk},
+            UpdateExpression="SET #s = :s, updated_at = :u",
+            ExpressionAttributeNames={"#s": "span"},
+            ExpressionAttributeValues={":s": span, ":u": now},
+        )
+    return len(pairs)
+
+def delete_keys(keys):
+    """Batch-delete chunk rows by SK."""
+    with table.batch_writer() as batch:
+        for sk in keys:
+            batch.delete_item(Key={"PK": f"ORG#{ORG_ID}#GUIDELINES", "SK": sk})
+    return len(keys)
+
+def bump_version():
+    """Advance the partition's version item so cached indices reload (see vector_index.partition_version)."""
+    table.update_item(
+        Key={"PK": f"ORG#{ORG_ID}#GUIDELINES", "SK": VERSION_SK},
+        UpdateExpression="ADD revision :one SET updated_at = :u",
+        ExpressionAttributeValues={":one": 1, ":u": datetime.utcnow().isoformat()+"Z"},
+    )
+
+def ingest_corpus(paths, tier=None, batch_size=BATCH_SIZE, workers=WRITE_WORKERS, dtype=EMBEDDING_DTYPE,
+                  incremental=False, prune_missing=False, max_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP,
+                  max_tokens=None):
+    """
+    Batched, parallel ingestion pipeline.
+
+    Chunks are streamed from all files, encoded `batch_size` at a time, and each
+    encoded batch is handed to a bounded pool of writer threads so DynamoDB writes
+    overlap with encoding of the next batch. Returns the number of chunks written.
+
+    With `incremental`, chunks whose content hash and tier are unchanged are neither
+    re-embedded nor rewritten, and chunk keys that an ingested document no longer
+    produces (it shrank) are deleted. `prune_missing` also deletes every chunk of
+    documents that are not in `paths` at all.
+    """
+    t0 = time.time()
+    written, pending = 0, set()
+    chunks = iter_chunks(paths, tier, max_words, overlap, max_tokens)
+    stats, seen, respan = {"skipped": 0, "deleted": 0}, set(), []
+    if incremental:
+        known = existing_chunks()
+        chunks = _changed_only(chunks, known, seen, stats, respan)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(chunks, batch_size):
+            embs = embedding_model.encode([c for _, _, _, c, _ in batch], batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True)
+            items = [make_item(uri, t, i, c, span, emb, dtype) for (uri, t, i, c, span), emb in zip(batch, embs)]
+            # bound the number of in-flight batches so memory stays flat on huge corpora
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += sum(f.result() for f in done)
+            pending.add(pool.submit(write_items, items))
+        written += sum(f.result() for f in pending)
+    if incremental:
+        uris = {os.path.basename(p) for p in paths}
+        orphans = [sk for sk in known if sk not in seen and (prune_missing or uri_of(sk) in uris)]
+        stats["deleted"] = delete_keys(orphans)
+        update_spans(respan)
+    if written or stats["deleted"] or respan:
+        bump_version()
+    dt = time.time() - t0
+    print(f"Ingested {written} chunks in {dt:.1f}s ({written / (dt or 1e-9):.1f} chunks/sec).")
+    if incremental:
+        print(f"Incremental: {stats['skipped']} unchanged chunk(s) skipped, {stats['deleted']} orphaned chunk(s) deleted.")
+    return written
+
+def ingest_path(path, tier, dtype=EMBEDDING_DTYPE, incremental=False):
+    return ingest_corpus([path], tier=tier, dtype=dtype, incremental=incremental)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embed guideline documents into EmbeddingsTable.")
+    ap.add_argument("paths", nargs="*", help="Files to ingest (default: corpus/*)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Chunks per encode/write batch")
+    ap.add_argument("--workers", type=int, default=WRITE_WORKERS, help="Concurrent DynamoDB writer threads")
+    ap.add_argument("--dtype", default=EMBEDDING_DTYPE, choices=["float32", "float16"])
+    ap.add_argument("--max-words", type=int, default=CHUNK_WORDS, help="Words per chunk")
+    ap.add_argument("--max-tokens", type=int, default=None, help="Model tokens per chunk (overrides --max-words)")
+    ap.add_argument("--overlap", type=int, default=CHUNK_OVERLAP, help="Words/tokens repeated between chunks")
+    ap.add_argument("--incremental", action="store_true", help="Skip unchanged chunks and delete orphaned ones")
+    ap.add_argument("--prune", action="store_true", help="With --incremental, also delete documents not in paths")
+    args = ap.parse_args()
+
+    paths = args.paths or sorted(glob.glob("corpus/*"))
+    ingest_corpus(paths, batch_size=args.batch_size, workers=args.workers, dtype=args.dtype,
+                  incremental=args.incremental, prune_missing=args.prune,
+                  max_words=args.max_words, overlap=args.overlap, max_tokens=args.max_tokens)
+    print("Ingested guideline chunks into DynamoDB.")
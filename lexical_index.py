@@ -0,0 +1,102 @@
+# lexical_index.py
+# BM25 inverted index over guideline chunk content.
+#
+# Term frequencies are computed once at ingest time and stored on each chunk row as
+# a compact `terms` string ("water:3 sparkling:1 ..."); the in-process index only
+# has to sum them into postings. Each posting already holds its final BM25 weight,
+# so scoring a query is a gather + segment sum over the postings of its terms.
+
+import re
+from collections import Counter
+import numpy as np
+
+K1 = 1.5
+B  = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have i if in into is it its me my no not of on or our
+please so than that the their them then there these they this to too us was we were what when which
+who will with would you your
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def encode_terms(text):
+    """Term frequencies of `text` as the compact string stored on chunk rows."""
+    return " ".join(f"{t}:{n}" for t, n in sorted(Counter(tokenize(text)).items()))
+
+def decode_terms(s):
+    out = {}
+    for pair in s.split():
+        t, _, n = pair.rpartition(":")
+        out[t] = int(n)
+    return out
+
+def item_terms(item):
+    """Term frequencies of a chunk row: the stored `terms`, or tokenized `content` for older rows."""
+    if item.get("terms") is not None:
+        return decode_terms(item["terms"])
+    return Counter(tokenize(item.get("content", "")))
+
+class BM25Index:
+    """
+    Inverted index with precomputed BM25 posting weights.
+
+    Attributes:
+        postings (dict): term -> (row ids as int32 array, BM25 weights as float32 array).
+        n (int): Number of indexed rows.
+    """
+    def __init__(self, docs_tf, k1=K1, b=B):
+        self.n = len(docs_tf)
+        dl = np.array([sum(tf.values()) for tf in docs_tf], dtype=np.float32)
+        avgdl = float(dl.mean()) if self.n and dl.mean() > 0 else 1.0
+        raw = {}
+        for row, tf in enumerate(docs_tf):
+            for t, c in tf.items():
+                raw.setdefault(t, []).append((row, c))
+        self.postings = {}
+        for t, plist in raw.items():
+            ids = np.array([r for r, _ in plist], dtype=np.int32)
+            tfs = np.array([c for _, c in plist], dtype=np.float32)
+            idf = np.log(1.0 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5))
+            w = idf * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * dl[ids] / avgdl))
+            self.postings[t] = (ids, w.astype(np.float32))
+
+    @classmethod
+    def from_items(cls, items):
+        return cls([item_terms(it) for it in items])
+
+    def search(self, query, limit=None, allowed=None):
+        """
+        Rows sharing at least one term with `query`, with their BM25 scores.
+
+        Args:
+            query (str): Raw query text.
+            limit (int): Keep only the `limit` best rows (default: all matches).
+            allowed (np.ndarray): Optional boolean row mask.
+
+        Returns:
+            tuple: (row ids, scores), best first.
+        """
+        hits = [self.postings[t] for t in set(tokenize(query)) if t in self.postings]
+        if not hits:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate([h[0] for h in hits])
+        ws = np.concatenate([h[1] for h in hits])
+        if allowed is not None:
+            keep = allowed[ids]
+            ids, ws = ids[keep], ws[keep]
+        if len(ids) == 0:
+            return ids.astype(np.int64), ws
+        order = np.argsort(ids, kind="stable")
+        ids, ws = ids[order], ws[order]
+        rows, starts = np.unique(ids, return_index=True)
+        scores = np.add.reduceat(ws, starts)
+        if limit is not None and limit < len(rows):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            rows, scores = rows[top], scores[top]
+        best = np.argsort(-scores, kind="stable")
+        return rows[best].astype(np.int64), scores[best]
@@ -0,0 +1,58 @@
+# migrate_embeddings.py
+# Convert legacy Decimal-list embeddings in EmbeddingsTable to the packed Binary format.
+#
+# Usage:
+#   python migrate_embeddings.py                  # float32, all guideline partitions
+#   python migrate_embeddings.py --dtype float16
+#   python migrate_embeddings.py --dry-run
+
+import argparse
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from embedding_codec import DTYPES, embedding_attrs, is_packed, unpack_item
+
+REGION     = "us-east-2"
+TABLE_NAME = "EmbeddingsTable"
+
+def migrate(table, dtype="float32", dry_run=False, progress_every=100):
+    """Rewrite every row whose embedding is still a list; returns (scanned, converted)."""
+    scanned = converted = 0
+    start_key = None
+    try:
+        with table.batch_writer() as batch:
+            while True:
+                kwargs = {}
+                if start_key:
+                    kwargs["ExclusiveStartKey"] = start_key
+                resp = table.scan(**kwargs)
+                for it in resp.get("Items", []):
+                    scanned += 1
+                    if "embedding" not in it:
+                        continue
+                    if is_packed(it) and it.get("embedding_dtype", "float32") == dtype:
+                        continue
+                    it.update(embedding_attrs(unpack_item(it), dtype))
+                    if not dry_run:
+                        batch.put_item(Item=it)
+                    converted += 1
+                    if converted % progress_every == 0:
+                        print(f"Converted {converted} item(s)...")
+                start_key = resp.get("LastEvaluatedKey")
+                if not start_key:
+                    break
+    except (BotoCoreError, ClientError) as e:
+        print(f"Error migrating '{table.name}': {e}")
+    return scanned, converted
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Pack EmbeddingsTable embeddings into Binary attributes.")
+    ap.add_argument("--table", default=TABLE_NAME)
+    ap.add_argument("--dtype", default="float32", choices=sorted(DTYPES))
+    ap.add_argument("--dry-run", action="store_true", help="Count rows that would change without writing.")
+    args = ap.parse_args()
+
+    table = boto3.resource("dynamodb", region_name=REGION).Table(args.table)
+    scanned, converted = migrate(table, dtype=args.dtype, dry_run=args.dry_run)
+    verb = "Would convert" if args.dry_run else "Converted"
+    print(f"{verb} {converted}/{scanned} item(s) in '{args.table}' to packed {args.dtype}.")
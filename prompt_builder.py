@@ -2,22 +2,15 @@
 
 import json
 from decimal import Decimal
-import numpy as np, boto3
-from boto3.dynamodb.conditions import Key
-from sentence_transformers import SentenceTransformer
+from retrieval import retrieve_chunks, retrieve_many, format_snippets
+from request_clusters import cluster_requests
+from sales_summary import sales_block
 from dotenv import load_dotenv
-import os
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 load_dotenv()
 
-REGION       = "us-east-2"
-TABLE_NAME   = "EmbeddingsTable"
-ORG_ID       = "demo"
 TOP_K        = 2
-
-ddb   = boto3.resource("dynamodb", region_name=REGION).Table(TABLE_NAME)
-embed = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+SNIPPET_TOKEN_BUDGET = 600   # max tokens of guideline text per prompt
 
 class DecimalEncoder(json.JSONEncoder):
     """
@@ -30,50 +23,20 @@ class DecimalEncoder(json.JSONEncoder):
             else:
                 return int(o)
         return super(DecimalEncoder, self).default(o)
-    
-def cosine(a, b):
-    a = np.array(a, dtype=float); b = np.array(b, dtype=float)
-    den = (np.linalg.norm(a) * np.linalg.norm(b)) or 1e-9
-    return float(np.dot(a, b) / den)
-
-def retrieve_chunks(question, k=TOP_K, prefer_sot=True, pk=None):
-    qvec = embed.encode([question])[0].tolist()
-    # 2) pull chunks for this org (paginate if needed)
-    items, resp = [], ddb.query(KeyConditionExpression=Key("PK").eq(pk or f"ORG#{ORG_ID}#GUIDELINES"))
-    items.extend(resp["Items"])
-    while "LastEvaluatedKey" in resp:  # pagination for >1MB responses
-        resp = ddb.query(
-            KeyConditionExpression=Key("PK").eq(pk or f"ORG#{ORG_ID}#GUIDELINES"),
-            ExclusiveStartKey=resp["LastEvaluatedKey"]
-        )
-        items.extend(resp["Items"])
-
-    # 3) score by cosine
-    for it in items:
-        vec = [float(x) for x in it["embedding"]]
-        it["_score"] = cosine(qvec, vec)
-
-    # 4) sort: SoT first (if desired), then score
-    if prefer_sot:
-        items.sort(key=lambda x: (x.get("tier") != "SoT", -x["_score"]))
-    else:
-        items.sort(key=lambda x: -x["_score"])
-
-    return items[:k]
-
-def format_snippets(snips):
-    # Make a compact, citeable context block
-    blocks = []
-    for s in snips:
-        tag = f"[{s.get('tier','Ref')}] {s.get('uri','?')} {s.get('span','')}"
-        blocks.append(f"{tag}\n{s['content']}")
-    return "\n\n---\n\n".join(blocks)
 
 def ask_with_rag(user_question):
     snips = retrieve_chunks(user_question, k=TOP_K, prefer_sot=True)
-    context = format_snippets(snips)
+    context = format_snippets(snips, SNIPPET_TOKEN_BUDGET, question=user_question)
     return context
 
+def ask_with_rag_many(questions):
+    # one retrieval per distinct question (batched), merged into a single guideline block
+    questions = list(dict.fromkeys(q for q in questions if q and q.strip()))
+    if not questions:
+        return ask_with_rag("")
+    _, merged = retrieve_many(questions, k=TOP_K, prefer_sot=True)
+    return format_snippets(merged, SNIPPET_TOKEN_BUDGET, question=" ".join(questions))
+
 def build_prompt(current_state, historical_events, supplier_info, current_date):
     """
     Constructs the system and user prompts for the Claude LLM.
@@ -84,7 +47,11 @@ def build_prompt(current_state, historical_events, supplier_info, current_date):
         supplier_info (list): A list of products and their buying prices.
 
     Returns:
-        str: A single string containing the full prompt for the LLM.
+        dict: `system` and `messages` for anthropic `messages.create`. The system
+        directives and the supplier table come first and carry cache_control
+        breakpoints, so that prefix is served from the prompt cache across cycles
+        and machines. The guideline snippets follow uncached: they are retrieved
+        for each day's customer requests and rarely repeat within the cache TTL.
     """
     system_prompt = """
     You are an AI agent designed to make rational decisions for restocking a vending machine. Your purpose is to optimize long-term profit while preserving and efficiently using all existing stock.
@@ -105,16 +72,17 @@ def build_prompt(current_state, historical_events, supplier_info, current_date):
     When an empty vending machine is given with no customer history, assume you are stocking a new machine and start with the best possible initialization.
     
     ### Your Output:
-    You must provide your decision in a strict JSON format. The JSON should contain two top-level keys:
+    Submit your decision by calling the `submit_restock_plan` tool. Its input is a strict JSON object with three top-level keys:
     -   `reasoning`: A string describing your reasoning for the decision.
-    -   `restock_plan`: A list of objects. Each object must have `product_name` and `quantity_to_buy` and `selling_price` to sell it at and `final quantity` which is current quantity available + quantity to buy. quantity_to_buy: this is what needs to be bought to accomplish the new-start given the old state. If there is already a product in the vending machine which is fully stocked, isn't cannot be removed. You cannot overstock. You basically buy what you need to get to the proposed new state based on what you have and dont have given thre supplier costs
+    -   `guideline_use`: What you learned from the given guidelines and how you used it.
+    -   `restock_plan`: A list of objects. Each object must have `product_name` and `quantity_to_buy` and `selling_price` to sell it at and `final_quantity` which is current quantity available + quantity to buy. quantity_to_buy: this is what needs to be bought to accomplish the new-start given the old state. If there is already a product in the vending machine which is fully stocked, isn't cannot be removed. You cannot overstock. You basically buy what you need to get to the proposed new state based on what you have and dont have given thre supplier costs
     
-    Example output format:
+    Example tool input:
     ```json
     {
       "restock_plan": [
-        {"product_name": "Snickers", "quantity_to_buy": 5, "selling_price": 2.0, "final_quantity: 10"},
-        {"product_name": "Coke", "quantity_to_buy": 10 "selling_price": 2.0, "final_quantity: 10"}
+        {"product_name": "Snickers", "quantity_to_buy": 5, "selling_price": 2.0, "final_quantity": 10},
+        {"product_name": "Coke", "quantity_to_buy": 10, "selling_price": 2.0, "final_quantity": 10}
       ],
       "reasoning": "give_reason_here",
       "guideline_use": "What did you learn from the given guidelines and how you used it"
@@ -123,7 +91,10 @@ def build_prompt(current_state, historical_events, supplier_info, current_date):
     """
     
     # Format the data for the user prompt
-    rag_guidelines = ask_with_rag("".join([e['title'] for e in historical_events if e['type'] == 'request']))
+    # near-duplicate customer requests collapse to one representative + count,
+    # for both retrieval and the prompt
+    request_clusters, other_requests = cluster_requests(historical_events)
+    rag_guidelines = ask_with_rag_many([c['request'] for c in request_clusters])
     user_prompt_data = {
         "current_date": current_date,
         "vending_machine_state": {
@@ -131,13 +102,25 @@ def build_prompt(current_state, historical_events, supplier_info, current_date):
             "current_stock": current_state['stock']
         },
         "historical_data": {
-            "transactions": [e for e in historical_events if e['type'] == 'transaction'],
-            "requests": [e for e in historical_events if e['type'] == 'request']
-        },
-        "supplier_information": supplier_info,
-        "supervison_guidelines": rag_guidelines
+            # per-product aggregates + a small raw sample, bounded in tokens however busy the day was
+            **sales_block(historical_events, current_state['stock']),
+            "requests": request_clusters,
+            "other_requests": other_requests
+        }
     }
-    
+
+    # stable prefix first (byte-identical between cycles, hence the sort), per-day data last
+    suppliers = sorted(supplier_info, key=lambda s: str(s.get('product_name', '')))
+    supplier_block = json.dumps({"supplier_information": suppliers}, indent=2, cls=DecimalEncoder)
+    guideline_block = json.dumps({"supervison_guidelines": rag_guidelines}, indent=2, cls=DecimalEncoder)
     user_prompt = json.dumps(user_prompt_data, indent=2, cls=DecimalEncoder)
-    
-    return f"Human: {system_prompt}\n\nHere is the data for today's restock decision:\n{user_prompt}\n\nAssistant:"
\ No newline at end of file
+
+    cached = {"type": "ephemeral"}
+    return {
+        "system": [{"type": "text", "text": system_prompt, "cache_control": cached}],
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": f"Supplier catalog:\n{supplier_block}", "cache_control": cached},
+            {"type": "text", "text": f"Business practice guidelines:\n{guideline_block}"},
+            {"type": "text", "text": f"Here is the data for today's restock decision:\n{user_prompt}"},
+        ]}],
+    }
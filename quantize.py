@@ -0,0 +1,78 @@
+# quantize.py
+# Reduced-dimension / int8 copies of the embedding matrix for a cheap first retrieval pass.
+#
+# A spec string picks the representation:
+#   "int8"          per-dimension symmetric int8 scalar quantization (4x smaller)
+#   "pca128"        PCA projection to 128 dims, float32 (3x smaller)
+#   "pca128+int8"   both (12x smaller)
+# The first pass ranks every row on the compact copy; the best candidates are then
+# rescored exactly against the float32 matrix. With a memory-mapped snapshot that
+# rescoring only pages in the candidate rows, so the resident cost per worker is the
+# compact copy.
+
+import re
+import numpy as np
+
+TRAIN_SAMPLE = 50000    # rows used to fit the PCA basis
+SCORE_BLOCK  = 65536    # rows per block when upcasting int8 codes for scoring
+
+_SPEC = re.compile(r"^(?:pca(\d+))?(?:\+?(int8))?$")
+
+def parse_spec(method):
+    """(dims or None, int8) for a quantization spec, or None if `method` is not one."""
+    m = _SPEC.match(method or "")
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    return (int(m.group(1)) if m.group(1) else None, bool(m.group(2)))
+
+class QuantizedMatrix:
+    """
+    Compact first-pass copy of an (n, dim) normalized matrix.
+
+    Attributes:
+        mean (np.ndarray): PCA centre, or None without PCA.
+        basis (np.ndarray): (dims, dim) orthonormal PCA components, or None.
+        codes (np.ndarray): (n, dims) int8 codes, or float32 rows when not int8.
+        scale (np.ndarray): (dims,) per-dimension int8 step, or None.
+    """
+    def __init__(self, matrix, dims=None, int8=True, seed=0):
+        self.mean = self.basis = self.scale = None
+        x = np.asarray(matrix, dtype=np.float32)
+        if dims and dims < x.shape[1]:
+            rng = np.random.default_rng(seed)
+            sample = x[rng.choice(len(x), min(len(x), TRAIN_SAMPLE), replace=False)]
+            self.mean = sample.mean(0)
+            _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.basis = np.ascontiguousarray(vt[:dims], dtype=np.float32)
+            # centering only shifts every score by the same q . mean, so rankings are unchanged
+            x = np.concatenate([(x[i:i + SCORE_BLOCK] - self.mean) @ self.basis.T
+                                for i in range(0, len(x), SCORE_BLOCK)]) if len(x) else x[:, :dims]
+        if int8:
+            self.scale = np.maximum(np.abs(x).max(0) if len(x) else np.ones(x.shape[1]), 1e-9) / 127.0
+            self.codes = np.clip(np.rint(x / self.scale), -127, 127).astype(np.int8)
+        else:
+            self.codes = np.ascontiguousarray(x, dtype=np.float32)
+
+    @property
+    def nbytes(self):
+        extra = sum(a.nbytes for a in (self.mean, self.basis, self.scale) if a is not None)
+        return self.codes.nbytes + extra
+
+    def project(self, q):
+        q = np.asarray(q, dtype=np.float32)
+        if self.basis is not None:
+            q = self.basis @ q
+        if self.scale is not None:
+            q = q * self.scale   # fold the dequantization step into the query
+        return q.astype(np.float32)
+
+    def scores(self, q, rows=None):
+        """Approximate scores (up to a per-query constant) of `rows` (index array or slice; default all)."""
+        pq = self.project(q)
+        codes = self.codes if rows is None else self.codes[rows]
+        if codes.dtype != np.int8:
+            return codes @ pq
+        out = np.empty(len(codes), dtype=np.float32)
+        for i in range(0, len(codes), SCORE_BLOCK):
+            out[i:i + SCORE_BLOCK] = codes[i:i + SCORE_BLOCK].astype(np.float32) @ pq
+        return out
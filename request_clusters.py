@@ -0,0 +1,72 @@
+# request_clusters.py
+# Collapse a day's customer `request` events into a few representative wishes.
+#
+# A busy machine logs hundreds of near-identical requests ("please add water",
+# "Could you stock water?", ...). Sending them verbatim makes both the prompt and the
+# RAG query grow with foot traffic. Here identical texts (after normalization) are
+# counted once, the distinct texts are embedded in one batch, and greedy leader
+# clustering by cosine groups paraphrases: texts are visited most frequent first and
+# join the first cluster whose leader they are close to, else start a new one. Each
+# cluster is reported by its most frequent wording plus counts.
+
+import numpy as np
+
+from embedding_cache import cached_encode, normalize
+
+SIMILARITY   = 0.80   # cosine at which two requests ask for the same thing
+MAX_CLUSTERS = 20     # clusters kept for the prompt; the rest are only counted
+
+def cluster_requests(events, threshold=SIMILARITY, max_clusters=MAX_CLUSTERS):
+    """
+    Group request events by meaning.
+
+    Args:
+        events (list): Events; only those with type "request" and a title are used.
+        threshold (float): Cosine similarity for joining a cluster.
+        max_clusters (int): Largest clusters to return; None returns all.
+
+    Returns:
+        tuple: (clusters, dropped). clusters is a list of dicts with "request" (the
+        representative text), "count" (events in the cluster), "variants" (distinct
+        wordings) and "first_seen"/"last_seen" times, largest first; dropped is the
+        number of events in clusters beyond max_clusters.
+    """
+    texts = {}   # normalized text -> {"text", "count", "first", "last"}
+    for e in events:
+        if e.get("type") != "request" or not (e.get("title") or "").strip():
+            continue
+        key = normalize(e["title"])
+        t = texts.setdefault(key, {"text": e["title"].strip(), "count": 0, "first": None, "last": None})
+        t["count"] += 1
+        when = e.get("time")
+        if when:
+            t["first"] = min(t["first"] or when, when)
+            t["last"] = max(t["last"] or when, when)
+    if not texts:
+        return [], 0
+
+    # most frequent wording first, so it becomes its cluster's representative
+    uniq = sorted(texts.values(), key=lambda t: (-t["count"], t["text"]))
+    vecs = np.asarray(cached_encode([t["text"] for t in uniq]), dtype=np.float32)
+    vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+    leaders, clusters = [], []
+    for t, v in zip(uniq, vecs):
+        if leaders:
+            sims = np.stack(leaders) @ v
+            j = int(np.argmax(sims))
+            if sims[j] >= threshold:
+                c = clusters[j]
+                c["count"] += t["count"]
+                c["variants"] += 1
+                c["first_seen"] = min(filter(None, (c["first_seen"], t["first"])), default=None)
+                c["last_seen"] = max(filter(None, (c["last_seen"], t["last"])), default=None)
+                continue
+        leaders.append(v)
+        clusters.append({"request": t["text"], "count": t["count"], "variants": 1,
+                         "first_seen": t["first"], "last_seen": t["last"]})
+
+    clusters.sort(key=lambda c: -c["count"])
+    if max_clusters is None or len(clusters) <= max_clusters:
+        return clusters, 0
+    return clusters[:max_clusters], sum(c["count"] for c in clusters[max_clusters:])
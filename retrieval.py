@@ -0,0 +1,66 @@
+# retrieval.py
+# Guideline retrieval shared by prompt_builder (restock prompts) and retrieve (RAG answers).
+#
+# Questions are embedded through the persistent query-embedding cache and scored
+# against this org's index: a local memory-mapped snapshot if one is configured, else
+# the process-wide index loaded once from DynamoDB. Hits are packed into a compact,
+# citeable context block. Callers pass their own k and snippet token budget.
+
+import boto3
+from vector_index import get_index, index_version, merge_results
+from snapshot import open_snapshot
+from snippet_packer import pack_snippets
+from embedding_cache import cached_encode
+
+REGION     = "us-east-2"
+TABLE_NAME = "EmbeddingsTable"
+ORG_ID     = "demo"
+
+ddb = boto3.resource("dynamodb", region_name=REGION).Table(TABLE_NAME)
+
+def retrieve_chunks(question, k, prefer_sot=True, pk=None, method="exact", nprobe=None):
+    # method: "exact" brute-force cosine (default), "hybrid" BM25 prefilter + cosine,
+    #         "ivfpq" approximate (see ann_index; tune nprobe for recall), or a quantized
+    #         first pass with exact rescoring: "int8", "pca128", "pca128+int8" (see quantize)
+    qvec = cached_encode([question])[0]  # persistent query-embedding cache
+    # 2) local snapshot or process-wide index for this org
+    index = open_index(pk)
+    # 3) score by cosine in one matvec, 4) top-k with SoT first (if desired)
+    return index.search(qvec, k, prefer_sot=prefer_sot, method=method, nprobe=nprobe, text=question)
+
+def retrieve_many(questions, k, prefer_sot=True, pk=None, method="exact", nprobe=None):
+    """
+    Retrieve for many questions at once.
+
+    All questions are embedded in one batch and scored with a single
+    matrix-matrix product. Returns (per_question, merged): the top-k list for
+    each question, and their union with duplicates removed (best score kept).
+    """
+    questions = list(questions)
+    if not questions:
+        return [], []
+    qmat = cached_encode(questions)
+    per_question = open_index(pk).search_many(qmat, k, prefer_sot=prefer_sot, method=method,
+                                              nprobe=nprobe, texts=questions)
+    return per_question, merge_results(per_question, prefer_sot)
+
+def open_index(pk=None):
+    # local memory-mapped snapshot if configured, else the process-wide index for this org
+    # (loaded once from DynamoDB, rebuilt when its version item changes)
+    pk = pk or f"ORG#{ORG_ID}#GUIDELINES"
+    index = open_snapshot(pk)
+    if index is None:
+        index = get_index(ddb, pk)
+    return index
+
+def guidelines_version(pk=None):
+    # version of the partition retrieval reads, without loading it: the resident index's
+    # while it is fresh, else one GetItem of the partition's version item
+    pk = pk or f"ORG#{ORG_ID}#GUIDELINES"
+    snap = open_snapshot(pk)
+    return list(snap.version) if snap is not None else list(index_version(ddb, pk))
+
+def format_snippets(snips, budget, question=None):
+    # Make a compact, citeable context block: near-duplicates dropped, trimmed to the token budget
+    blocks = [f"{tag}\n{text}" for tag, text in pack_snippets(snips, budget=budget, question=question)]
+    return "\n\n---\n\n".join(blocks)
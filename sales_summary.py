@@ -0,0 +1,117 @@
+# sales_summary.py
+# Compact per-product features of a day's transaction events for the restock prompt.
+#
+# build_prompt used to embed every raw transaction (UUID, timestamp, price) in the
+# prompt, so its size, latency and cost grew with the number of customers. Instead it
+# gets per-product aggregates (units, revenue, hourly histogram, sell-out time), the
+# count of visits that ended without a purchase, and a small evenly spaced sample of
+# raw events, all held under a hard token budget (slow sellers are aggregated as
+# "other" when needed). A busy day and a quiet day then produce prompts of about
+# the same size.
+
+import json
+
+from snippet_packer import estimate_tokens
+
+SALE_TYPES         = {"transaction", "purchase"}
+NO_PURCHASE        = {"None", "No stock"}   # titles the simulators log for a visit without a sale
+SAMPLE_SIZE        = 8                      # raw events kept as examples
+SALES_TOKEN_BUDGET = 1200                   # max tokens for summary + sample
+SAMPLE_FIELDS      = ("time", "type", "title", "price")
+
+def _hour(e):
+    t = e.get("time") or ""
+    return t[11:13] if len(t) >= 13 else None   # "YYYY-MM-DD HH:MM:SS"
+
+def _bump(hist, e):
+    h = _hour(e)
+    if h is not None:
+        hist[h] = hist.get(h, 0) + 1
+
+def summarize_sales(events, stock=None):
+    """
+    Aggregate a day's events.
+
+    Args:
+        events (list): Raw events for the day.
+        stock (list): Current stock items (product_name, quantity); a product at
+            quantity 0 is reported as sold out at the time of its last sale.
+
+    Returns:
+        dict: "products" mapping product name to units, revenue, hourly (hour ->
+        units, non-zero hours only) and sold_out_at; "no_purchase" with count and
+        hourly; "visits" with the total number of customer visits.
+    """
+    left = {s["product_name"]: int(s.get("quantity", 0)) for s in (stock or []) if s.get("product_name")}
+    products, none = {}, {"count": 0, "hourly": {}}
+    visits = 0
+    for e in sorted(events, key=lambda e: e.get("time") or ""):
+        if e.get("type") == "visit_no_stock" or (e.get("type") in SALE_TYPES and e.get("title") in NO_PURCHASE):
+            visits += 1
+            none["count"] += 1
+            _bump(none["hourly"], e)
+            continue
+        if e.get("type") not in SALE_TYPES:
+            continue
+        visits += 1
+        p = products.setdefault(e["title"], {"units": 0, "revenue": 0.0, "hourly": {}, "sold_out_at": None})
+        p["units"] += 1
+        p["revenue"] += float(e.get("price") or 0)
+        _bump(p["hourly"], e)
+        if left.get(e["title"]) == 0:
+            p["sold_out_at"] = e.get("time")   # last sale of a product now at zero
+    for p in products.values():
+        p["revenue"] = round(p["revenue"], 2)
+    ranked = dict(sorted(products.items(), key=lambda kv: (-kv[1]["units"], kv[0])))
+    return {"products": ranked, "no_purchase": none, "visits": visits}
+
+def sample_events(events, n=SAMPLE_SIZE):
+    """`n` raw events evenly spaced over the day (deterministic), without ids."""
+    ordered = sorted(events, key=lambda e: e.get("time") or "")
+    if len(ordered) > n:
+        step = len(ordered) / n
+        ordered = [ordered[int(i * step)] for i in range(n)]
+    out = [{f: e[f] for f in SAMPLE_FIELDS if f in e} for e in ordered]
+    for e in out:
+        if "price" in e:
+            e["price"] = float(e["price"])   # DynamoDB Decimal
+    return out
+
+def prompt_json(block):
+    """`block` serialized as build_prompt renders it: indent=2, two levels deep under historical_data."""
+    return json.dumps({"historical_data": block}, indent=2)
+
+def sales_block(events, stock=None, budget=SALES_TOKEN_BUDGET, sample_size=SAMPLE_SIZE):
+    """
+    Summary + raw sample for the prompt, shrunk until it fits `budget` tokens.
+
+    The cost is measured on prompt_json, the indented form the model actually
+    sees, not on compact JSON.
+
+    Trimmed in order: the sample, hourly histograms from the slowest sellers up,
+    the no-purchase histogram, and finally the slowest-selling products
+    themselves, which are folded into an "other_products" aggregate (count,
+    units, revenue). Only if that aggregate alone exceeds the budget can the
+    block end up larger.
+    """
+    txn = [e for e in events if e.get("type") in SALE_TYPES or e.get("type") == "visit_no_stock"]
+    summary = summarize_sales(txn, stock)
+    block = {"sales_summary": summary, "transaction_sample": sample_events(txn, sample_size)}
+    cost = lambda: estimate_tokens(prompt_json(block))
+    while block["transaction_sample"] and cost() > budget:
+        block["transaction_sample"].pop()
+    for p in reversed(list(summary["products"].values())):
+        if cost() <= budget:
+            break
+        p.pop("hourly", None)
+    if cost() > budget:
+        summary["no_purchase"].pop("hourly", None)
+    if cost() > budget:
+        other = summary["other_products"] = {"count": 0, "units": 0, "revenue": 0.0}
+        names = list(summary["products"])
+        while names and cost() > budget:
+            p = summary["products"].pop(names.pop())
+            other["count"] += 1
+            other["units"] += p["units"]
+            other["revenue"] = round(other["revenue"] + p["revenue"], 2)
+    return block
@@ -0,0 +1,109 @@
+# snapshot.py
+# Local, memory-mapped snapshot of a guideline partition for offline runs and simulations.
+#
+# A snapshot directory holds:
+#   embeddings.npy  (n, dim) float32, rows L2-normalized
+#   content.bin     every chunk's UTF-8 content, back to back
+#   meta.json       columnar metadata: SK, uri, span, tier, updated_at, BM25 terms,
+#                   content offset/length
+#
+# Readers open embeddings.npy with np.load(mmap_mode="r") and content.bin with mmap,
+# so any number of worker processes share one page-cached copy and retrieval never
+# touches DynamoDB. Set EMBEDDINGS_SNAPSHOT_DIR to make retrieve_chunks use it.
+#
+# Usage:
+#   python snapshot.py --pk "ORG#demo#GUIDELINES" --out snapshots
+
+import os, re, json, mmap, argparse, threading
+import numpy as np
+
+from vector_index import VectorIndex
+from lexical_index import encode_terms
+
+SNAPSHOT_DIR = os.getenv("EMBEDDINGS_SNAPSHOT_DIR")
+META_FIELDS  = ("SK", "uri", "span", "tier", "updated_at", "terms")
+
+def snapshot_path(root, pk):
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", pk))
+
+def export(vindex, path):
+    """Write `vindex` (matrix + chunk metadata + content) as a snapshot directory."""
+    os.makedirs(path, exist_ok=True)
+    meta = {f: [] for f in META_FIELDS}
+    meta.update({"pk": vindex.pk, "version": list(vindex.version), "offset": [], "length": []})
+    offset = 0
+    with open(os.path.join(path, "content.bin.tmp"), "wb") as f:
+        for it in vindex.items:
+            data = it.get("content", "").encode("utf-8")
+            f.write(data)
+            meta["offset"].append(offset); meta["length"].append(len(data))
+            offset += len(data)
+            it = dict(it, terms=it.get("terms") or encode_terms(it.get("content", "")))
+            for field in META_FIELDS:
+                meta[field].append(str(it.get(field, "")))
+    with open(os.path.join(path, "embeddings.npy.tmp"), "wb") as f:
+        np.save(f, np.ascontiguousarray(vindex.matrix, dtype=np.float32))
+    with open(os.path.join(path, "meta.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, separators=(",", ":"))
+    # meta.json goes last: readers treat its appearance/mtime as "snapshot ready"
+    for name in ("content.bin", "embeddings.npy", "meta.json"):
+        os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+    return len(vindex)
+
+class SnapshotIndex(VectorIndex):
+    """A VectorIndex whose matrix and chunk content are memory-mapped from a snapshot directory."""
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        items = [dict(zip(META_FIELDS, row)) for row in zip(*(meta[f] for f in META_FIELDS))]
+        matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        super().__init__(items, version=tuple(meta["version"]), pk=meta["pk"], matrix=matrix)
+        self.path = path
+        self.offsets, self.lengths = meta["offset"], meta["length"]
+        self.mtime = os.path.getmtime(os.path.join(path, "meta.json"))
+        self._content = None
+        size = os.path.getsize(os.path.join(path, "content.bin"))
+        if size:
+            with open(os.path.join(path, "content.bin"), "rb") as f:
+                self._content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def item(self, i):
+        it = dict(self.items[i])
+        start = self.offsets[i]
+        it["content"] = self._content[start:start + self.lengths[i]].decode("utf-8") if self._content else ""
+        return it
+
+_snapshots = {}   # path -> SnapshotIndex
+_lock = threading.Lock()
+
+def open_snapshot(pk, root=None):
+    """
+    The snapshot index for `pk` under `root` (default EMBEDDINGS_SNAPSHOT_DIR),
+    or None when no snapshot is configured or present. Re-opened when re-exported.
+    """
+    root = root or SNAPSHOT_DIR
+    if not root:
+        return None
+    path = snapshot_path(root, pk)
+    meta = os.path.join(path, "meta.json")
+    if not os.path.exists(meta):
+        return None
+    with _lock:
+        idx = _snapshots.get(path)
+        if idx is None or os.path.getmtime(meta) != idx.mtime:
+            idx = _snapshots[path] = SnapshotIndex(path)
+        return idx
+
+if __name__ == "__main__":
+    import boto3
+
+    ap = argparse.ArgumentParser(description="Export a guideline partition to a local memory-mappable snapshot.")
+    ap.add_argument("--pk", default="ORG#demo#GUIDELINES")
+    ap.add_argument("--table", default="EmbeddingsTable")
+    ap.add_argument("--out", default=SNAPSHOT_DIR or "snapshots", help="Snapshot root directory")
+    args = ap.parse_args()
+
+    table = boto3.resource("dynamodb", region_name="us-east-2").Table(args.table)
+    path = snapshot_path(args.out, args.pk)
+    n = export(VectorIndex.load(table, args.pk), path)
+    print(f"Exported {n} chunk(s) of {args.pk} to {path}. Set EMBEDDINGS_SNAPSHOT_DIR={args.out} to use it.")
@@ -0,0 +1,99 @@
+# snippet_packer.py
+# Token-budgeted packing of retrieved guideline chunks into the prompt's context block.
+#
+# Retrieved chunks vary wildly in size, so a fixed TOP_K gives a guideline block of
+# unpredictable length. The packer walks the ranked snippets, drops near-duplicates
+# (embedding cosine) and chunks whose line span overlaps one already kept, and trims
+# a snippet to its paragraphs that share the most terms with the question when it
+# does not fit whole. Citation tags ("[SoT] file L12-L40") are never altered.
+
+import re
+import numpy as np
+
+from lexical_index import tokenize
+
+DEDUP_THRESHOLD = 0.92    # cosine above which two chunks count as the same guidance
+ELLIPSIS = "[…]"          # marks paragraphs dropped from the middle of a snippet
+
+_SPAN = re.compile(r"L(\d+)-L(\d+)")
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; good enough to bound the block
+    return len(text) // 4 + 1
+
+def citation(s):
+    return f"[{s.get('tier','Ref')}] {s.get('uri','?')} {s.get('span','')}"
+
+def _lines(s):
+    m = _SPAN.fullmatch(s.get("span", "") or "")
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+def _overlaps(a, b):
+    if a.get("uri") != b.get("uri"):
+        return False
+    la, lb = _lines(a), _lines(b)
+    return la is not None and lb is not None and la[0] <= lb[1] and lb[0] <= la[1]
+
+def _duplicate(s, kept, threshold):
+    v = s.get("_vec")
+    for k in kept:
+        if _overlaps(s, k):
+            return True
+        if v is not None and k.get("_vec") is not None and float(np.dot(v, k["_vec"])) >= threshold:
+            return True
+    return False
+
+def trim(text, question, budget):
+    """
+    The paragraphs of `text` most relevant to `question` that fit in `budget` tokens,
+    kept in source order. Returns "" if not even one paragraph fits.
+    """
+    paras = [p for p in text.split("\n\n") if p.strip()]
+    q = set(tokenize(question or ""))
+    # rank by question-term overlap; ties keep earlier paragraphs first
+    ranked = sorted(range(len(paras)), key=lambda i: (-len(q & set(tokenize(paras[i]))), i))
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(paras[i]) + estimate_tokens(ELLIPSIS)
+        if used + cost <= budget:
+            chosen.append(i); used += cost
+    chosen.sort()
+    out = []
+    for j, i in enumerate(chosen):
+        if (j == 0 and i > 0) or (j > 0 and i != chosen[j - 1] + 1):
+            out.append(ELLIPSIS)
+        out.append(paras[i])
+    if chosen and chosen[-1] != len(paras) - 1:
+        out.append(ELLIPSIS)
+    return "\n\n".join(out)
+
+def pack_snippets(snips, budget=None, question=None, dedup_threshold=DEDUP_THRESHOLD):
+    """
+    Select and trim ranked snippets to fit a token budget.
+
+    Args:
+        snips (list): Retrieved chunks, best first (as returned by retrieve_chunks).
+        budget (int): Token budget for the whole block; None packs every non-duplicate whole.
+        question (str): The retrieval question, used to pick paragraphs when trimming.
+        dedup_threshold (float): Cosine similarity at which a chunk is a near-duplicate.
+
+    Returns:
+        list: (citation tag, text) pairs in rank order.
+    """
+    kept, out, used = [], [], 0
+    for s in snips:
+        if _duplicate(s, kept, dedup_threshold):
+            continue
+        tag = citation(s)
+        cost = estimate_tokens(tag) + estimate_tokens(s["content"])
+        if budget is None or used + cost <= budget:
+            text = s["content"]
+        else:
+            text = trim(s["content"], question, budget - used - estimate_tokens(tag))
+            if not text:
+                continue
+            cost = estimate_tokens(tag) + estimate_tokens(text)
+        kept.append(s)
+        out.append((tag, text))
+        used += cost
+    return out
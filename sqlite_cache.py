@@ -0,0 +1,59 @@
+# sqlite_cache.py
+# Shared plumbing for the local SQLite caches (query embeddings, RAG answers, restock
+# decisions): one WAL-mode connection per process, a schema given by the subclass,
+# least-recently-used eviction past a row bound, hit/miss counters, and a lazily
+# opened process-wide default instance.
+
+import os, sqlite3, threading
+
+class SQLiteLRU:
+    """
+    Base class for an LRU-bounded SQLite cache table.
+
+    Subclasses set TABLE and COLUMNS (which must include `last_used REAL`), plus
+    optional extra INDEXES as (name, column list) pairs, and call _evict() with the
+    lock held after inserting.
+
+    Attributes:
+        hits (int): Lookups served from the cache by this process.
+        misses (int): Lookups that fell through to the real work.
+    """
+    TABLE = COLUMNS = None
+    INDEXES = ()
+
+    def __init__(self, path, max_entries):
+        self.path, self.max_entries = path, max_entries
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.COLUMNS})")
+        for name, cols in (*self.INDEXES, (f"{self.TABLE}_lru", "last_used")):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {self.TABLE}({cols})")
+        self._db.commit()
+
+    def _evict(self):
+        # drop least-recently-used rows beyond the size bound (caller holds the lock)
+        self._db.execute(
+            f"DELETE FROM {self.TABLE} WHERE rowid IN ("
+            f" SELECT rowid FROM {self.TABLE} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+def lazy_default(factory):
+    """A function returning one process-wide `factory()` instance, created on first call (thread-safe)."""
+    lock, box = threading.Lock(), []
+    def default():
+        if not box:
+            with lock:
+                if not box:  # another thread may have opened it while we waited
+                    box.append(factory())
+        return box[0]
+    return default
@@ -0,0 +1,134 @@
+# stream_json.py
+# Incremental parsing of a streamed restock decision.
+#
+# The decision is the submit_restock_plan tool input: one bare JSON object, streamed
+# as input_json_delta fragments (no prose, no fences). The parser is fed those
+# fragments as they arrive. It tracks string/escape state and the container stack,
+# so it knows when each element of the top-level "restock_plan" array starts and
+# ends. Object elements are parsed and validated as soon as they close; any other
+# element is rejected as soon as it starts. Malformed output (a bad plan entry,
+# mismatched brackets, a key with no colon, or anything but an object at the top
+# level) raises StreamAbort right away, so the caller can close the stream instead
+# of waiting for up to 8192 tokens it will throw away. A "restock_plan" that is not
+# an array at all is left to validate_decision on the finished object.
+
+import json
+
+PLAN_KEY = "restock_plan"
+
+class StreamAbort(ValueError):
+    """The streamed decision is malformed; stop reading it."""
+
+def is_whole(x):
+    """True for ints and integral floats (5, 5.0); bools, NaN and infinities are not."""
+    return not isinstance(x, bool) and (isinstance(x, int) or (isinstance(x, float) and x.is_integer()))
+
+def validate_plan_entry(entry):
+    """Raise StreamAbort unless `entry` is a usable restock_plan item."""
+    if not isinstance(entry, dict):
+        raise StreamAbort(f"restock_plan entry is not an object: {entry!r}")
+    name = entry.get("product_name")
+    if not isinstance(name, str) or not name.strip():
+        raise StreamAbort(f"restock_plan entry without product_name: {entry!r}")
+    qty = entry.get("quantity_to_buy", 0)
+    if not is_whole(qty) or qty < 0:
+        raise StreamAbort(f"bad quantity_to_buy for {name!r}: {qty!r}")
+    price = entry.get("selling_price")
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0):
+        raise StreamAbort(f"bad selling_price for {name!r}: {price!r}")
+    return entry
+
+class DecisionParser:
+    """
+    Feed streamed text; plan entries are validated as soon as they close.
+
+    Attributes:
+        entries (list): Validated restock_plan entries seen so far.
+        result (dict): The whole decision once the top-level object has closed, else None.
+    """
+    def __init__(self, on_entry=None):
+        self.on_entry = on_entry
+        self.entries, self.result = [], None
+        self._buf = []            # JSON text from the opening brace on
+        self._pos = 0             # offset of the next character in the JSON text
+        self._stack = []          # [type, key it is stored under, start offset]
+        self._in_str = self._esc = False
+        self._str_start = None
+        self._last_str = None
+        self._expect = None       # "key", "colon" or None inside objects
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def feed(self, text):
+        for ch in text:
+            if self.done:
+                return
+            if not self._stack and ch != "{":
+                if ch.isspace():
+                    continue
+                raise StreamAbort(f"decision is not a JSON object: starts with {ch!r}")
+            self._buf.append(ch)
+            self._step(ch)
+            self._pos += 1
+
+    def _step(self, ch):
+        if self._in_str:
+            if self._esc:
+                self._esc = False
+            elif ch == "\\":
+                self._esc = True
+            elif ch == '"':
+                self._in_str = False
+                raw = "".join(self._buf[self._str_start:self._pos + 1])
+                self._last_str = json.loads(raw)
+                if self._expect == "key":
+                    self._expect = "colon"
+            return
+        if ch.isspace():
+            return
+        if self._in_plan() and ch not in "{,]":
+            raise StreamAbort(f"restock_plan entry is not an object: starts with {ch!r}")
+        if self._expect == "colon" and ch != ":":
+            raise StreamAbort(f"expected ':' after key {self._last_str!r}, got {ch!r}")
+        if ch == '"':
+            self._in_str, self._str_start = True, self._pos
+        elif ch == ":":
+            self._expect = None
+        elif ch == ",":
+            self._expect = "key" if self._stack[-1][0] == "{" else None
+        elif ch in "{[":
+            parent = self._stack[-1] if self._stack else None
+            key = self._last_str if parent and parent[0] == "{" else None
+            self._stack.append([ch, key, self._pos])
+            self._expect = "key" if ch == "{" else None
+        elif ch in "}]":
+            if not self._stack or {"}": "{", "]": "["}[ch] != self._stack[-1][0]:
+                raise StreamAbort(f"unbalanced {ch!r} in response")
+            kind, key, start = self._stack.pop()
+            self._expect = None
+            if self._is_plan_entry():
+                self._entry("".join(self._buf[start:self._pos + 1]))
+            if not self._stack:
+                try:
+                    self.result = json.loads("".join(self._buf))
+                except json.JSONDecodeError as e:
+                    raise StreamAbort(f"invalid JSON: {e}") from e
+
+    def _in_plan(self):
+        # directly inside the root["restock_plan"] array
+        return len(self._stack) == 2 and self._stack[1][0] == "[" and self._stack[1][1] == PLAN_KEY
+
+    def _is_plan_entry(self):
+        # just closed an object directly inside root["restock_plan"]
+        return self._in_plan() and self._buf[self._pos] == "}"
+
+    def _entry(self, raw):
+        try:
+            entry = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise StreamAbort(f"invalid restock_plan entry {raw!r}: {e}") from e
+        self.entries.append(validate_plan_entry(entry))
+        if self.on_entry:
+            self.on_entry(entry)
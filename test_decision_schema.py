@@ -0,0 +1,48 @@
+# test_decision_schema.py
+# validate_decision must report every violation as an error string and never raise:
+# VendingAgent's repair retry depends on it.
+
+from decision_schema import validate_decision
+
+def entry(**overrides):
+    e = {"product_name": "Coke", "quantity_to_buy": 5, "selling_price": 2.0, "final_quantity": 10}
+    e.update(overrides)
+    return {k: v for k, v in e.items() if v is not None}
+
+def decision(*entries):
+    return {"restock_plan": list(entries), "reasoning": "r", "guideline_use": "g"}
+
+def test_valid_decision():
+    assert validate_decision(decision(entry(), entry(product_name="Water"))) == []
+
+def test_missing_fields_are_reported():
+    for field in ("quantity_to_buy", "selling_price", "final_quantity"):
+        errors = validate_decision(decision(entry(**{field: None})))
+        assert any("missing" in e and field in e for e in errors), (field, errors)
+    errors = validate_decision({"restock_plan": []})
+    assert "missing required field 'reasoning'" in errors
+
+def test_extra_fields_are_reported():
+    errors = validate_decision(decision(entry(note="x")))
+    assert any("unexpected note" in e for e in errors)
+    assert any("unexpected field 'extra'" in e for e in validate_decision(dict(decision(), extra=1)))
+
+def test_wrong_types_are_reported():
+    assert validate_decision(decision(entry(quantity_to_buy="5")))
+    assert validate_decision(decision(entry(selling_price="cheap")))
+    assert validate_decision(decision(entry(final_quantity=12)))
+    assert validate_decision(decision("Coke"))
+    assert validate_decision(dict(decision(), restock_plan="Coke"))
+    assert validate_decision(dict(decision(), reasoning=3))
+    assert validate_decision([])
+
+def test_integer_fields_accept_integral_floats_only():
+    assert validate_decision(decision(entry(quantity_to_buy=5.0, final_quantity=10.0))) == []
+    assert validate_decision(decision(entry(quantity_to_buy=5.5)))
+    assert validate_decision(decision(entry(final_quantity=9.5)))
+    assert validate_decision(decision(entry(final_quantity=True)))
+    assert validate_decision(decision(entry(quantity_to_buy=float("nan"))))
+
+def test_duplicates_and_capacity():
+    assert any("duplicate" in e for e in validate_decision(decision(entry(), entry())))
+    assert any("capacity" in e for e in validate_decision(decision(entry(quantity_to_buy=11))))
@@ -0,0 +1,31 @@
+# test_sales_summary.py
+# sales_block's token budget must hold for the block as build_prompt renders it
+# (indented and nested in the user prompt), not just for compact JSON.
+
+import json
+
+from sales_summary import SALES_TOKEN_BUDGET, sales_block
+from snippet_packer import estimate_tokens
+
+def busy_day(n=5000, products=40):
+    return [{"event_id": f"e{i}", "type": "transaction", "title": f"Product {i % products}",
+             "price": 1.5 + (i % 7) * 0.25, "time": f"2025-01-01 {6 + i % 16:02d}:{i % 60:02d}:{i % 60:02d}"}
+            for i in range(n)]
+
+def rendered_tokens(block):
+    # the block's share of build_prompt's user prompt: with it minus without it
+    def prompt(historical):
+        data = {"current_date": "2025-01-01", "vending_machine_state": {"balance": 100, "current_stock": []},
+                "historical_data": {**historical, "requests": [], "other_requests": []}}
+        return json.dumps(data, indent=2)
+    return estimate_tokens(prompt(block)) - estimate_tokens(prompt({}))
+
+def test_rendered_block_stays_under_budget():
+    for n in (10, 500, 5000):
+        block = sales_block(busy_day(n))
+        assert rendered_tokens(block) <= SALES_TOKEN_BUDGET, n
+
+def test_quiet_day_is_not_trimmed():
+    block = sales_block(busy_day(20, products=3))
+    assert block["transaction_sample"] and "other_products" not in block["sales_summary"]
+    assert all("hourly" in p for p in block["sales_summary"]["products"].values())
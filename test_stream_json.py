@@ -0,0 +1,37 @@
+# test_stream_json.py
+# DecisionParser must validate restock_plan entries while the tool input streams in,
+# and reject anything that is not the bare JSON object tool use produces.
+
+import json
+import pytest
+
+from stream_json import DecisionParser, StreamAbort
+
+DECISION = {"restock_plan": [{"product_name": "Coke", "quantity_to_buy": 5, "selling_price": 2.0,
+                              "final_quantity": 10}],
+            "reasoning": 'r {not json} \\" ]', "guideline_use": "g"}
+
+def feed(text, step=7):
+    parser = DecisionParser()
+    for i in range(0, len(text), step):
+        parser.feed(text[i:i + step])
+    return parser
+
+def test_chunked_object_round_trips():
+    parser = feed(json.dumps(DECISION))
+    assert parser.done and parser.result == DECISION
+    assert [e["product_name"] for e in parser.entries] == ["Coke"]
+
+def test_prose_or_fence_before_the_object_is_rejected():
+    for text in ("Here is {my} plan", "```json\n" + json.dumps(DECISION)):
+        with pytest.raises(StreamAbort):
+            feed(text)
+
+def test_non_object_plan_entries_abort_when_they_start():
+    for bad in ('{"restock_plan": [1, 2]', '{"restock_plan": ["Coke"', '{"restock_plan": [[]'):
+        with pytest.raises(StreamAbort):
+            feed(bad)
+
+def test_bad_entry_aborts_before_the_object_closes():
+    with pytest.raises(StreamAbort):
+        feed('{"restock_plan": [{"product_name": "Coke", "quantity_to_buy": -1}')
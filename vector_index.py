@@ -0,0 +1,404 @@
+# vector_index.py
+# Process-wide, in-memory vector index over a guideline partition of EmbeddingsTable.
+#
+# The partition is read once into a contiguous, pre-normalized float32 matrix so a
+# query is scored with one matrix-vector product and top-k comes from argpartition.
+# The cached index is rebuilt only when the partition's version item (maintained by
+# ingest.py) changes.
+
+import os, threading, time
+from collections import OrderedDict
+import numpy as np
+from boto3.dynamodb.conditions import Key
+
+from embedding_codec import unpack_item
+from lexical_index import BM25Index
+import ann_index
+import quantize
+
+CHUNK_PREFIX     = "DOC#"   # SK prefix of guideline chunk rows
+VERSION_SK       = "VERSION"  # SK of the per-partition version item
+REFRESH_SECONDS  = 30       # how often a cached index re-checks its partition version
+ANN_RERANK       = 4        # approximate candidates per requested result, rescored exactly
+LEXICAL_CANDIDATES = 200    # BM25 prefilter size for hybrid retrieval
+HYBRID_ALPHA     = 0.7      # weight of cosine vs. max-normalized BM25 in the fused score
+QUANT_RERANK     = 4        # quantized first-pass candidates per result, rescored in float32
+
+MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "512"))  # resident indices, all orgs
+
+def _query_all(table, pk, **kwargs):
+    """Query every chunk row of `pk`, following pagination."""
+    cond = Key("PK").eq(pk) & Key("SK").begins_with(CHUNK_PREFIX)
+    items, resp = [], table.query(KeyConditionExpression=cond, **kwargs)
+    items.extend(resp["Items"])
+    while "LastEvaluatedKey" in resp:  # pagination for >1MB responses
+        resp = table.query(KeyConditionExpression=cond, ExclusiveStartKey=resp["LastEvaluatedKey"], **kwargs)
+        items.extend(resp["Items"])
+    return items
+
+def _version_item(table, pk):
+    """(revision, updated_at) from the partition's version item, or None if it has none."""
+    it = table.get_item(Key={"PK": pk, "SK": VERSION_SK}).get("Item")
+    return (int(it["revision"]), it.get("updated_at", "")) if it is not None else None
+
+def partition_version(table, pk):
+    """
+    Fingerprint of a partition, read with one GetItem of its version item.
+
+    ingest.py bumps the item's `revision` and `updated_at` after every run that
+    writes, re-spans or deletes chunks. Partitions written before the version item
+    existed fall back to (chunk count, newest updated_at) over every chunk row;
+    Query bills the full item size whatever the projection, so that fallback costs
+    a full partition read.
+    """
+    version = _version_item(table, pk)
+    if version is not None:
+        return version
+    rows = _query_all(
+        table, pk,
+        ProjectionExpression="SK, updated_at",
+    )
+    return (len(rows), max((r.get("updated_at", "") for r in rows), default=""))
+
+def _normalize(mat):
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1e-9
+    return mat / norms
+
+class VectorIndex:
+    """
+    Pre-normalized float32 embedding matrix plus the chunk metadata it was built from.
+
+    Rows are partitioned by tier: all SoT chunks first, then Ref, so each tier is a
+    contiguous slice of `matrix` and can be scored on its own without copying.
+
+    Attributes:
+        items (list): Chunk rows without their `embedding` attribute, aligned with `matrix`.
+        matrix (np.ndarray): (n, dim) float32, each row L2-normalized, SoT rows first.
+        n_sot (int): Number of SoT rows; matrix[:n_sot] is SoT, matrix[n_sot:] is Ref.
+        is_sot (np.ndarray): Boolean mask of rows whose tier is "SoT".
+        version (tuple): `partition_version` the index was built at.
+    """
+    def __init__(self, items, version=None, pk="", matrix=None):
+        self.pk = pk
+        self._ann = None
+        self._bm25 = None
+        self._quant = {}            # quantization spec -> QuantizedMatrix
+        # stable SoT-first order; already-partitioned input (e.g. a snapshot) is left as is
+        order = sorted(range(len(items)), key=lambda i: items[i].get("tier") != "SoT")
+        partitioned = order == list(range(len(items)))
+        items = items if partitioned else [items[i] for i in order]
+        self.items = [{k: v for k, v in it.items() if k != "embedding"} for it in items]
+        if matrix is not None:
+            # already normalized, e.g. a memory-mapped snapshot
+            self.matrix = matrix if partitioned else np.ascontiguousarray(matrix[order])
+        elif items:
+            mat = np.stack([unpack_item(it) for it in items]).astype(np.float32, copy=False)
+            self.matrix = np.ascontiguousarray(_normalize(mat))
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.is_sot = np.array([it.get("tier") == "SoT" for it in self.items], dtype=bool)
+        self.n_sot = int(self.is_sot.sum())
+        self.version = version if version is not None else (
+            len(items), max((it.get("updated_at", "") for it in items), default="")
+        )
+        self.checked_at = time.time()
+
+    @classmethod
+    def load(cls, table, pk):
+        """Read the whole partition once and build the index from it."""
+        # version first: a write landing mid-read only makes the next check reload
+        version = _version_item(table, pk)
+        return cls(_query_all(table, pk), version=version, pk=pk)
+
+    def __len__(self):
+        return len(self.items)
+
+    def nbytes(self):
+        """Approximate resident size: matrix, derived indices and chunk text."""
+        size = self.matrix.nbytes if not isinstance(self.matrix, np.memmap) else 0
+        size += sum(qm.nbytes for qm in self._quant.values())
+        if self._ann is not None:
+            size += self._ann.nbytes()
+        if self._bm25 is not None:
+            size += sum(ids.nbytes + w.nbytes for ids, w in self._bm25.postings.values())
+        return size + sum(len(it.get("content", "")) + 256 for it in self.items)
+
+    def item(self, i):
+        """A fresh copy of row `i`'s chunk metadata."""
+        return dict(self.items[i])
+
+    def scores(self, qvec):
+        """Cosine score of every row against `qvec` (one matrix-vector product)."""
+        q = np.asarray(qvec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1e-9)
+        return self.matrix @ q
+
+    def ann(self):
+        """IVF-PQ index over `matrix`, loaded from disk or built on first use."""
+        if self._ann is None:
+            # row order is part of the version: persisted codes are positional
+            self._ann = ann_index.load_or_build(self.matrix, f"{self.version}|sot-first", self.pk or "default")
+        return self._ann
+
+    def bm25(self):
+        """BM25 index over the chunks' ingest-time `terms`, built on first use."""
+        if self._bm25 is None:
+            self._bm25 = BM25Index.from_items(self.items)
+        return self._bm25
+
+    def quantized(self, spec):
+        """QuantizedMatrix for a parsed spec (dims, int8), built on first use."""
+        if spec not in self._quant:
+            self._quant[spec] = quantize.QuantizedMatrix(self.matrix, dims=spec[0], int8=spec[1])
+        return self._quant[spec]
+
+    def _tier(self, tier):
+        """(row slice, boolean mask) for "SoT", "Ref" or None (every row)."""
+        if tier == "SoT":
+            return slice(0, self.n_sot), self.is_sot
+        if tier == "Ref":
+            return slice(self.n_sot, len(self.items)), ~self.is_sot
+        return slice(0, len(self.items)), None
+
+    def _rank(self, q, tier, k, method, nprobe, text=None, full=None):
+        """
+        (row ids, scores) of the top-k rows of `tier` ("SoT", "Ref" or None), best first.
+
+        `full` optionally holds the precomputed cosine of every row against `q`
+        (a column of a batched matrix-matrix product) so exact scoring is skipped.
+        """
+        part, mask = self._tier(tier)
+        rows = np.arange(part.start, part.stop)
+        if method == "exact":
+            # the tier is a contiguous slice: score only it, no gather/copy of the matrix
+            scores = full[part] if full is not None else self.matrix[part] @ q
+            top = _top_k(scores, np.arange(len(rows)), k)
+            return rows[top], scores[top]
+        if method == "ivfpq":
+            # approximate candidates, then exact rescoring of the few survivors
+            cand, _ = self.ann().search(q, k * ANN_RERANK, nprobe=nprobe, allowed=mask)
+            if len(cand) < min(k, len(rows)):  # short candidate set: never return fewer than exact would
+                return self._rank(q, tier, k, "exact", nprobe, full=full)
+            scores = self.matrix[cand] @ q
+            top = _top_k(scores, np.arange(len(cand)), k)
+            return cand[top], scores[top]
+        if method == "hybrid":
+            # BM25 prefilter: only chunks sharing a term with the question are vector-scored
+            cand, lex = self.bm25().search(text or "", limit=LEXICAL_CANDIDATES, allowed=mask)
+            if len(cand) < k:  # too little lexical overlap, fall back to pure vector search
+                return self._rank(q, tier, k, "exact", nprobe, full=full)
+            vec = full[cand] if full is not None else self.matrix[cand] @ q
+            fused = HYBRID_ALPHA * vec + (1 - HYBRID_ALPHA) * lex / lex[0]
+            top = _top_k(fused, np.arange(len(cand)), k)
+            return cand[top], fused[top]
+        spec = quantize.parse_spec(method)
+        if spec is not None:
+            # compact first pass over the tier, exact float32 rescoring of the best
+            approx = self.quantized(spec).scores(q, part)
+            cand = rows[_top_k(approx, np.arange(len(rows)), k * QUANT_RERANK)]
+            scores = self.matrix[cand] @ q
+            top = _top_k(scores, np.arange(len(cand)), k)
+            return cand[top], scores[top]
+        raise ValueError(f"Unknown retrieval method: {method!r}")
+
+    def _search_rows(self, q, k, prefer_sot, method, nprobe, text=None, full=None):
+        if prefer_sot:
+            # SoT answers from its own partition; Ref is only consulted to fill empty slots
+            rows, scores = self._rank(q, "SoT", k, method, nprobe, text, full)
+            if len(rows) < k:
+                more, more_scores = self._rank(q, "Ref", k - len(rows), method, nprobe, text, full)
+                rows, scores = np.concatenate([rows, more]), np.concatenate([scores, more_scores])
+            return rows, scores
+        return self._rank(q, None, k, method, nprobe, text, full)
+
+    def _results(self, rows, scores):
+        out = []
+        for i, score in zip(rows, scores):
+            it = self.item(i)
+            it["_score"] = float(score)
+            it["_vec"] = self.matrix[i]  # normalized embedding, used for snippet de-duplication
+            out.append(it)
+        return out
+
+    def search(self, qvec, k, prefer_sot=True, method="exact", nprobe=None, text=None):
+        """
+        Top-k rows for `qvec`, as copies of the chunk metadata with a `_score` key.
+
+        With prefer_sot, SoT chunks rank ahead of Ref chunks regardless of score,
+        matching the old `(tier != "SoT", -score)` sort. `method` is "exact"
+        (brute force), "ivfpq" (approximate, see ann_index; `nprobe` lists),
+        "hybrid" (BM25 prefilter on the question `text`, fused with cosine) or a
+        quantization spec such as "int8" / "pca128+int8" (see quantize).
+        """
+        if not self.items or k <= 0:
+            return []
+        q = np.asarray(qvec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1e-9)
+        return self._results(*self._search_rows(q, k, prefer_sot, method, nprobe, text))
+
+    def search_many(self, qmat, k, prefer_sot=True, method="exact", nprobe=None, texts=None):
+        """
+        `search` for a batch of queries; returns one result list per row of `qmat`.
+
+        Exact scoring shares one (n, dim) x (dim, m) matrix product for the whole
+        batch. Hybrid keeps its BM25 prefilter and vector-scores only each query's
+        own lexical candidates, fewer rows than the product would cover; ivfpq and
+        quantized methods also score each query separately.
+        """
+        Q = np.atleast_2d(np.asarray(qmat, dtype=np.float32))
+        if not self.items or k <= 0:
+            return [[] for _ in Q]
+        Q = Q / np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-9)
+        texts = texts if texts is not None else [None] * len(Q)
+        S = self.matrix @ Q.T if method == "exact" else None
+        return [
+            self._results(*self._search_rows(q, k, prefer_sot, method, nprobe, text,
+                                             None if S is None else S[:, j]))
+            for j, (q, text) in enumerate(zip(Q, texts))
+        ]
+
+def merge_results(per_question, prefer_sot=True):
+    """Union of per-question results with one entry per chunk (its best score), ranked like search."""
+    best = {}
+    for res in per_question:
+        for it in res:
+            if it["SK"] not in best or it["_score"] > best[it["SK"]]["_score"]:
+                best[it["SK"]] = it
+    if prefer_sot:
+        return sorted(best.values(), key=lambda x: (x.get("tier") != "SoT", -x["_score"]))
+    return sorted(best.values(), key=lambda x: -x["_score"])
+
+def _top_k(scores, rows, k):
+    """Indices from `rows` with the k highest scores, best first."""
+    if len(rows) == 0 or k <= 0:
+        return rows[:0]
+    sub = scores[rows]
+    if k < len(rows):
+        part = np.argpartition(-sub, k - 1)[:k]
+    else:
+        part = np.arange(len(rows))
+    part = part[np.argsort(-sub[part], kind="stable")]
+    return rows[part]
+
+class IndexManager:
+    """
+    Per-org index residency under a memory budget.
+
+    Each partition key (one org's guidelines, e.g. "ORG#acme#GUIDELINES") is its
+    own shard, loaded lazily on first use and kept in LRU order. When the resident
+    total exceeds `memory_budget` bytes, least-recently-used shards are evicted
+    (never the one just requested). Loads of different orgs run concurrently.
+
+    Attributes:
+        stats (dict): pk -> {"hits", "misses", "loads", "load_s", "last_load_s"}.
+    """
+    def __init__(self, memory_budget=MEMORY_BUDGET_MB * 2**20, refresh_seconds=REFRESH_SECONDS):
+        self.memory_budget = memory_budget
+        self.refresh_seconds = refresh_seconds
+        self.stats = {}
+        self._resident = OrderedDict()   # pk -> VectorIndex, least recently used first
+        self._lock = threading.Lock()
+        self._pk_locks = {}
+
+    def get(self, table, pk):
+        """The resident index for `pk`, loading or refreshing it if needed."""
+        with self._lock:
+            st = self.stats.setdefault(pk, {"hits": 0, "misses": 0, "loads": 0, "load_s": 0.0, "last_load_s": 0.0})
+            pk_lock = self._pk_locks.setdefault(pk, threading.Lock())
+        with pk_lock:
+            with self._lock:
+                idx = self._resident.get(pk)
+                if idx is not None:
+                    self._resident.move_to_end(pk)
+            now = time.time()
+            if idx is not None and now - idx.checked_at < self.refresh_seconds:
+                st["hits"] += 1
+                return idx
+            if idx is not None and partition_version(table, pk) == idx.version:
+                idx.checked_at = now
+                st["hits"] += 1
+                return idx
+            st["misses"] += 1
+            t0 = time.perf_counter()
+            idx = VectorIndex.load(table, pk)
+            dt = time.perf_counter() - t0
+            st["loads"] += 1; st["load_s"] += dt; st["last_load_s"] = dt
+            with self._lock:
+                self._resident[pk] = idx
+                self._resident.move_to_end(pk)
+                self._evict(keep=pk)
+            return idx
+
+    def version(self, table, pk):
+        """
+        Current version of `pk` without loading it.
+
+        While the resident index is within its refresh window its version is
+        returned with no read; otherwise one partition_version read, which also
+        counts as the refresh check of a resident index it matches.
+        """
+        with self._lock:
+            idx = self._resident.get(pk)
+        now = time.time()
+        if idx is not None and now - idx.checked_at < self.refresh_seconds:
+            return idx.version
+        version = partition_version(table, pk)
+        if idx is not None and version == idx.version:
+            idx.checked_at = now
+        return version
+
+    def _evict(self, keep):
+        total = sum(i.nbytes() for i in self._resident.values())
+        for pk in list(self._resident):
+            if total <= self.memory_budget:
+                break
+            if pk == keep:
+                continue
+            total -= self._resident.pop(pk).nbytes()
+
+    def invalidate(self, pk=None):
+        with self._lock:
+            if pk is None:
+                self._resident.clear()
+            else:
+                self._resident.pop(pk, None)
+
+    def report(self):
+        """Per-org hit rate, load time and resident size."""
+        with self._lock:
+            resident = {pk: i.nbytes() for pk, i in self._resident.items()}
+            out = {}
+            for pk, st in self.stats.items():
+                total = st["hits"] + st["misses"]
+                out[pk] = {
+                    **st,
+                    "load_s": round(st["load_s"], 4),
+                    "last_load_s": round(st["last_load_s"], 4),
+                    "hit_rate": round(st["hits"] / total, 3) if total else 0.0,
+                    "avg_load_s": round(st["load_s"] / st["loads"], 4) if st["loads"] else 0.0,
+                    "resident_mb": round(resident[pk] / 2**20, 2) if pk in resident else 0.0,
+                }
+            return out
+
+manager = IndexManager()
+
+def get_index(table, pk, refresh_seconds=None):
+    """
+    Return the process-wide index for `pk`, loading it on first use.
+
+    At most every `refresh_seconds` the partition version is re-read; the index is
+    rebuilt only if the chunk count or newest `updated_at` changed. Residency
+    across orgs is managed by `manager` (see IndexManager).
+    """
+    if refresh_seconds is not None:
+        manager.refresh_seconds = refresh_seconds
+    return manager.get(table, pk)
+
+def index_version(table, pk):
+    """Version of `pk` as retrieval would see it (see IndexManager.version)."""
+    return manager.version(table, pk)
+
+def invalidate(pk=None):
+    """Drop the cached index for `pk` (or every partition) so the next call reloads."""
+    manager.invalidate(pk)
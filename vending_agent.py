@@ -6,57 +6,170 @@ import uuid
 
 from dynamodb_utils import DynamoDBManager
 from prompt_builder import build_prompt
+from retrieval import guidelines_version
 from llm_client import get_llm_client
 from prompt_builder import DecimalEncoder
+import embedding_model
+import embedding_server
+from embedding_cache import default_cache
+from decision_cache import decision_key, default_cache as decision_cache, BYPASS as DECISION_CACHE_BYPASS
+from stream_json import DecisionParser, StreamAbort
+from decision_schema import RESTOCK_TOOL, TOOL_CHOICE, TOOL_NAME, MAX_REPAIRS, validate_decision, repair_prompt
 from decimal import Decimal
 import time
+import os
+
+MODEL_ID = "claude-3-5-haiku-20241022"
 
 class VendingAgent:
     """
     The AI agent responsible for the vending machine restocking decisions.
     """
-    def __init__(self, init_budget=1000):
-        """Initializes the agent with a DynamoDB manager and an LLM client."""
+    def __init__(self, init_budget=1000, use_decision_cache=None, stream=None):
+        """
+        Initializes the agent with a DynamoDB manager and an LLM client.
+
+        use_decision_cache=False (or DECISION_CACHE_BYPASS=1) always asks the LLM.
+        stream=False (or LLM_STREAM=0) waits for the whole response instead of streaming it.
+        """
         self.db_manager = DynamoDBManager()
         self.llm_client = get_llm_client()
         self.initial_budget = init_budget
+        self.use_decision_cache = not DECISION_CACHE_BYPASS if use_decision_cache is None else use_decision_cache
+        self.stream = os.getenv("LLM_STREAM", "1") not in ("0", "false") if stream is None else stream
+        self.llm_usage = {}   # token counts summed over every LLM call (incl. prompt-cache reads/writes)
+        self.llm_metrics = {}  # latency of the last streamed call: ttft_s, tokens_per_s, ...
+
+    def _record_usage(self, usage):
+        """Adds a response's `usage` to self.llm_usage and returns it as a dict."""
+        fields = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+        counts = {f: getattr(usage, f, None) or 0 for f in fields}
+        for f, n in counts.items():
+            self.llm_usage[f] = self.llm_usage.get(f, 0) + n
+        return counts
+
+    def _stream_llm_decision(self, prompt):
+        """
+        Streams the submit_restock_plan tool call and parses its JSON as it arrives
+        (see stream_json).
+
+        A malformed restock_plan entry closes the stream right away instead of after
+        the full reply, raising StreamAbort. Time-to-first-token and tokens/sec go to
+        self.llm_metrics.
+        """
+        parser = DecisionParser()
+        t0 = time.time()
+        first = None
+        chars = 0
+        aborted = None
+        with self.llm_client.messages.stream(
+            model=MODEL_ID,
+            max_tokens=8192,
+            system=prompt["system"],
+            messages=prompt["messages"],
+            tools=[RESTOCK_TOOL],
+            tool_choice=TOOL_CHOICE
+        ) as stream:
+            try:
+                for event in stream:
+                    if event.type != "content_block_delta":
+                        continue
+                    if first is None:
+                        first = time.time()
+                    if event.delta.type == "input_json_delta":
+                        chars += len(event.delta.partial_json)
+                        parser.feed(event.delta.partial_json)
+                    elif event.delta.type == "text_delta":
+                        chars += len(event.delta.text)
+            except StreamAbort as e:
+                aborted = str(e)  # leaving the block closes the connection
+            message = None if aborted else stream.get_final_message()
+        t1 = time.time()
+
+        if message is not None:
+            print('LLM usage: ', self._record_usage(message.usage))
+        # an aborted stream has no usage; ~4 characters per token is close enough for a rate
+        output_tokens = message.usage.output_tokens if message is not None else chars // 4
+        gen_s = (t1 - first) if first else 0.0
+        self.llm_metrics = {
+            "ttft_s": round(first - t0, 3) if first else None,
+            "total_s": round(t1 - t0, 3),
+            "output_tokens": output_tokens,
+            "tokens_per_s": round(output_tokens / gen_s, 1) if gen_s > 0 else None,
+            "aborted": aborted,
+        }
+        print('LLM stream: ', self.llm_metrics)
+
+        if aborted:
+            raise StreamAbort(f"aborted after {len(parser.entries)} plan entries: {aborted}")
+        if message.stop_reason == "max_tokens":
+            raise StreamAbort("response hit max_tokens before the decision was complete")
+        return self._decision_from_message(message)
+
+    def _create_llm_decision(self, prompt):
+        """Blocking variant of _stream_llm_decision."""
+        response = self.llm_client.messages.create(
+            model=MODEL_ID,
+            max_tokens=8192,
+            system=prompt["system"],
+            messages=prompt["messages"],
+            tools=[RESTOCK_TOOL],
+            tool_choice=TOOL_CHOICE
+        )
+        print('LLM usage: ', self._record_usage(response.usage))
+        return self._decision_from_message(response)
+
+    def _decision_from_message(self, message):
+        """The submit_restock_plan input, or a ```json block in text as a fallback."""
+        for block in message.content:
+            if getattr(block, "type", None) == "tool_use" and block.name == TOOL_NAME:
+                return block.input
+        json_response_str = "".join(getattr(b, "text", "") for b in message.content)
+        json_start = json_response_str.find('```json')
+        if json_start != -1:
+            # Adjust start to skip the `json` marker
+            json_start += len('```json')
+            json_end = json_response_str.find('```', json_start)
+
+            # Extract the JSON string only
+            if json_end != -1:
+                json_string_to_parse = json_response_str[json_start:json_end].strip()
+            else:
+                # If the end marker isn't found, assume the rest is the JSON
+                json_string_to_parse = json_response_str[json_start:].strip()
+        else:
+            # If no markers are found, assume the whole response is the JSON
+            json_string_to_parse = json_response_str.strip()
+        return json.loads(json_string_to_parse)
 
     def _get_llm_decision(self, prompt):
-        """Sends the prompt to the LLM and parses the response."""
-        try:
-            response = self.llm_client.messages.create(
-                model="claude-3-5-haiku-20241022",
-                max_tokens=8192,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            # The LLM's response content is a list of content blocks.
-            # We're interested in the text content, which should be the JSON string.
-            json_response_str = response.content[0].text
-            # print(json_response_str)
-            json_start = json_response_str.find('```json')
-            if json_start != -1:
-                # Adjust start to skip the `json` marker
-                json_start += len('```json')
-                json_end = json_response_str.find('```', json_start)
-                
-                # Extract the JSON string only
-                if json_end != -1:
-                    json_string_to_parse = json_response_str[json_start:json_end].strip()
+        """
+        Sends the prompt (system + messages from build_prompt) to the LLM and returns
+        the decision it submits through the submit_restock_plan tool.
+
+        A decision that is malformed or violates the schema is retried up to
+        MAX_REPAIRS times, with the validation errors appended to the prompt.
+        """
+        errors = None
+        for attempt in range(MAX_REPAIRS + 1):
+            request = prompt if errors is None else repair_prompt(prompt, errors)
+            try:
+                if self.stream:
+                    decision = self._stream_llm_decision(request)
                 else:
-                    # If the end marker isn't found, assume the rest is the JSON
-                    json_string_to_parse = json_response_str[json_start:].strip()
-            else:
-                # If no markers are found, assume the whole response is the JSON
-                json_string_to_parse = json_response_str.strip()
-            decision = json.loads(json_string_to_parse)
-            print("LLM Decision (JSON):")
-            print(json.dumps(decision, indent=2))
-            return decision
-        except Exception as e:
-            print(f"Error getting or parsing LLM response: {e}")
-            return None
+                    decision = self._create_llm_decision(request)
+                errors = validate_decision(decision)
+            except (StreamAbort, json.JSONDecodeError) as e:
+                errors = [str(e)]
+            except Exception as e:
+                print(f"Error getting or parsing LLM response: {e}")
+                return None
+            if not errors:
+                print("LLM Decision (JSON):")
+                print(json.dumps(decision, indent=2))
+                return decision
+            print(f"Invalid LLM decision (attempt {attempt + 1} of {MAX_REPAIRS + 1}): {errors}")
+        return None
 
     def _calculate_restock_cost(self, restock_plan, supplier_info):
         """Calculates the total cost of the restock plan.
@@ -224,6 +337,10 @@ class VendingAgent:
         print(f"[{date}] Starting vending machine restock cycle...")
 
         t0 = time.time()
+        # load the embedding model in the background while we hit DynamoDB
+        # (not needed when a shared embedding server is running)
+        if not embedding_model.is_loaded() and not embedding_server.available():
+            embedding_model.warm_up(background=True)
         # 1. Fetch data from DynamoDB
         try:
             current_stock = self.db_manager.get_current_stock_state(date)
@@ -243,40 +360,66 @@ class VendingAgent:
         t1 = time.time()
         print('Time to load data: ', t1 - t0)
 
-        # 2. Build the prompt for the LLM
-        prompt = build_prompt(
-            current_state={'stock': current_stock, 'balance': current_balance},
-            historical_events=historical_events,
-            supplier_info=supplier_info,
-            current_date=date
-        )
-        t2 = time.time()
-        print('Time to Build Prompt: ', t2 - t1)
-        # print("--- LLM Prompt ---")
-        # print(prompt)
-        # print("------------------")
-
-        # 3. Get the restocking decision from the LLM
-        decision = self._get_llm_decision(prompt)
-        if not decision:
-            print("Failed to get a valid decision from the LLM. Aborting.")
-            return
-
-        t3 = time.time()
-        print('Time to Get LLM Decision: ', t3 - t2)
-
-        # 4. Process the decision and prepare data for update
         date_dt = datetime.strptime(date, "%Y-%m-%d")
         next_date = (date_dt + timedelta(days=1)).strftime("%Y-%m-%d")
 
-        try:
-            restock_plan = decision['restock_plan']
-            new_stock, new_balance = self._prepare_data_for_update(
-                current_stock, restock_plan, current_balance, supplier_info, next_date
+        # 2./3. Identical inputs seen before -> reuse that validated decision, else ask the LLM
+        cache_key = None
+        if self.use_decision_cache:
+            cache_key = decision_key(current_stock, current_balance, historical_events, supplier_info, MODEL_ID,
+                                     guidelines=guidelines_version())
+        decision = decision_cache().get(cache_key) if self.use_decision_cache else None
+        prepared = None
+        if decision is not None:
+            t2 = t3 = time.time()
+            print('Decision cache hit, skipped prompt build and LLM call.')
+            # 4. A replayed plan can still fail, e.g. cached just above a balance-bucket edge
+            try:
+                prepared = self._prepare_data_for_update(
+                    current_stock, decision['restock_plan'], current_balance, supplier_info, next_date
+                )
+            except (KeyError, ValueError, Exception) as e:
+                print(f"Cached decision no longer applies: {e}. Asking the LLM instead.")
+                decision_cache().delete(cache_key)
+        if prepared is None:
+            # 2. Build the prompt for the LLM
+            prompt = build_prompt(
+                current_state={'stock': current_stock, 'balance': current_balance},
+                historical_events=historical_events,
+                supplier_info=supplier_info,
+                current_date=date
             )
-        except (KeyError, ValueError, Exception) as e:
-            print(f"Decision processing failed: {e}. Aborting.")
-            return
+            t2 = time.time()
+            print('Time to Build Prompt: ', t2 - t1)
+            print('Query embedding cache: ', default_cache().stats())
+            # print("--- LLM Prompt ---")
+            # print(prompt)
+            # print("------------------")
+
+            # 3. Get the restocking decision from the LLM
+            decision = self._get_llm_decision(prompt)
+            if not decision:
+                print("Failed to get a valid decision from the LLM. Aborting.")
+                return
+
+            t3 = time.time()
+            print('Time to Get LLM Decision: ', t3 - t2)
+
+            # 4. Process the decision and prepare data for update
+            try:
+                restock_plan = decision['restock_plan']
+                prepared = self._prepare_data_for_update(
+                    current_stock, restock_plan, current_balance, supplier_info, next_date
+                )
+            except (KeyError, ValueError, Exception) as e:
+                print(f"Decision processing failed: {e}. Aborting.")
+                return
+            # only plans that passed validation are worth replaying
+            if self.use_decision_cache:
+                decision_cache().put(cache_key, decision, MODEL_ID, t3 - t2)
+        if self.use_decision_cache:
+            print('Decision cache: ', decision_cache().stats())
+        new_stock, new_balance = prepared
 
         t4 = time.time()
         print('Time to Prepare update: ', t4 - t3)